@@ -0,0 +1,42 @@
+from flask import request, jsonify
+
+from auth_simple import require_admin
+from model_store import ModelStoreError, activate, current_version, list_versions
+
+
+def init_admin_routes(app, model_registry):
+    @app.route('/admin/models', methods=['GET'])
+    @require_admin
+    def get_model_versions():
+        return jsonify({
+            'serving': model_registry.version,
+            'live': current_version(),
+            'versions': list_versions(),
+            'reloads': model_registry.reloads,
+            'last_reload_error': model_registry.last_reload_error,
+        })
+
+    @app.route('/admin/models/activate', methods=['POST'])
+    @require_admin
+    def activate_model_version():
+        """Make a published version live; every worker swaps it in within MODEL_STORE_POLL_SECONDS."""
+        version = (request.get_json(silent=True) or {}).get('version')
+        if not version:
+            return jsonify({"error": "version is required"}), 400
+        try:
+            activate(version)
+        except ModelStoreError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # This worker starts right away instead of waiting for its next poll
+        model_registry.reload_in_background()
+        return jsonify({'activated': version, 'serving': model_registry.version}), 202
+
+    @app.route('/admin/models/reload', methods=['POST'])
+    @require_admin
+    def reload_models():
+        """Reload the live version in this worker, e.g. after a failed swap was fixed."""
+        started = model_registry.reload_in_background()
+        return jsonify({'reloading': started, 'serving': model_registry.version}), 202
+
+    return app
@@ -1,45 +1,320 @@
-import torch
-from torchvision import transforms
-from PIL import Image
+"""
+Chest X-ray analysis outside the request path: one image, or thousands.
+
+Bulk analysis streams images from a directory, a glob pattern or a
+.tar/.tar.gz/.zip archive. A pool of decode threads prefetches and
+preprocesses the images while earlier ones go through the model in
+batches. Each result is written as one NDJSON line as soon as its batch
+finishes. At most BULK_PREFETCH images are held in memory at once,
+whatever the size of the source.
+
+With a checkpoint file, each analyzed image's name is recorded after its
+line has been written, and a rerun skips those images. Images that could
+not be decoded or analyzed are not recorded, so a rerun retries them. A
+crash can repeat at most one batch; no image is ever lost.
+
+Usage:
+    python analyze_image.py xray.jpg
+    python analyze_image.py studies/ --output results.ndjson
+    python analyze_image.py 'archive/**/*.png' --output results.ndjson --batch-size 64
+    python analyze_image.py studies.tar.gz --output results.ndjson   # rerun to resume
+"""
+import argparse
+import contextlib
+import fnmatch
+import glob
 import json
 import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from cxr_preprocess import prepare_decode
+from image_io import open_image_bytes
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, "models", "cxr_model.pt")
 CLASS_NAMES_PATH = os.path.join(BASE_DIR, "models", "cxr_class_names.json")
 
 # Load class names
 with open(CLASS_NAMES_PATH, "r") as f:
     CLASS_NAMES = json.load(f)
 
-# Preprocessing (must match training!)
-transform = transforms.Compose([
-    transforms.Resize((320, 320)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225]),
-])
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 32))
+BULK_DECODE_THREADS = int(os.environ.get('BULK_DECODE_THREADS', os.cpu_count() or 4))
+BULK_PREFETCH = int(os.environ.get('BULK_PREFETCH', 0)) or 2 * BULK_BATCH_SIZE
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp', '*.gif', '*.tif', '*.tiff', '*.webp')
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The chest X-ray model of the live model version, loaded once."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from model_registry import load_cxr_model
+            from model_store import current_bundle
+            _model = load_cxr_model(len(CLASS_NAMES), bundle=current_bundle())
+            if _model is None:
+                raise RuntimeError("Chest X-ray model not found.")
+    return _model
+
+
+def is_image_name(name):
+    return any(fnmatch.fnmatch(name.lower(), pattern) for pattern in IMAGE_PATTERNS)
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _in_memory(data):
+    return lambda: data
+
+
+def _tar_images(tar):
+    # Stream mode reads members in archive order; each one is read before the next is reached
+    for member in tar:
+        if member.isfile() and is_image_name(member.name):
+            yield member.name, _in_memory(tar.extractfile(member).read())
+
+
+def _zip_images(fileobj):
+    # Read here rather than on the decode threads: the archive may be closed by then
+    with zipfile.ZipFile(fileobj) as archive:
+        for name in archive.namelist():
+            if is_image_name(name):
+                yield name, _in_memory(archive.read(name))
+
+
+def iter_images(source):
+    """Yield (name, read) for every image in source; read() returns the image bytes.
+
+    source is an image file, a directory (searched recursively), a glob
+    pattern, a tar or zip archive path, or an open archive file object.
+    """
+    if not isinstance(source, str):
+        if zipfile.is_zipfile(source):
+            source.seek(0)
+            yield from _zip_images(source)
+        else:
+            source.seek(0)
+            with tarfile.open(fileobj=source, mode='r|*') as tar:
+                yield from _tar_images(tar)
+    elif os.path.isdir(source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if is_image_name(filename):
+                    path = os.path.join(dirpath, filename)
+                    yield os.path.relpath(path, source), partial(_read_file, path)
+    elif os.path.isfile(source) and source.lower().endswith(ARCHIVE_SUFFIXES):
+        if source.lower().endswith('.zip'):
+            yield from _zip_images(source)
+        else:
+            with tarfile.open(source, mode='r|*') as tar:
+                yield from _tar_images(tar)
+    elif os.path.isfile(source):
+        yield source, partial(_read_file, source)
+    else:
+        for path in sorted(glob.glob(source, recursive=True)):
+            if os.path.isfile(path) and is_image_name(path):
+                yield path, partial(_read_file, path)
+
+
+def _decode(name, read, transform):
+    """Read, decode and preprocess one image on a decode thread (PIL and NumPy release the GIL)."""
+    try:
+        return name, transform(open_image_bytes(read(), prepare=prepare_decode)), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def probabilities_record(name, probs, threshold, version):
+    return {
+        'source': name,
+        'predictions': [
+            {'condition': CLASS_NAMES[idx], 'probability': float(prob)}
+            for idx, prob in enumerate(probs) if prob >= threshold
+        ],
+        'probabilities': {CLASS_NAMES[idx]: float(prob) for idx, prob in enumerate(probs)},
+        'modelVersion': version,
+    }
+
+
+def ndjson_line(record):
+    """One NDJSON output line, with probabilities rounded to 4 digits to keep bulk output small."""
+    if 'probabilities' in record:
+        record = dict(
+            record,
+            predictions=[dict(p, probability=round(p['probability'], 4)) for p in record['predictions']],
+            probabilities={name: round(prob, 4) for name, prob in record['probabilities'].items()},
+        )
+    return json.dumps(record) + '\n'
+
+
+def analyze_images(images, cxr=None, threshold=0.5, batch_size=BULK_BATCH_SIZE,
+                   decode_threads=BULK_DECODE_THREADS, prefetch=BULK_PREFETCH, skip=()):
+    """Yield one batch of result records at a time, in completion order.
+
+    images is an iterable of (name, read) as produced by iter_images; names in
+    skip are not read at all. Images that cannot be decoded produce an
+    {'source', 'error'} record instead of stopping the run.
+    """
+    cxr = cxr or get_model()
+    batch_size = max(1, batch_size)
+    prefetch = max(batch_size, prefetch)
+    images = ((name, read) for name, read in images if name not in skip)
+
+    with ThreadPoolExecutor(max_workers=max(1, decode_threads), thread_name_prefix='cxr-decode') as pool:
+        pending, ready, exhausted = set(), [], False
+        while True:
+            # Keep the decode threads busy, without holding more than `prefetch` images
+            while not exhausted and len(pending) + len(ready) < prefetch:
+                item = next(images, None)
+                if item is None:
+                    exhausted = True
+                else:
+                    pending.add(pool.submit(_decode, *item, cxr.transform))
+
+            errors = []
+            if pending and len(ready) < batch_size:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, tensor, error = future.result()
+                    if error is None:
+                        ready.append((name, tensor))
+                    else:
+                        errors.append({'source': name, 'error': error})
+
+            records = errors
+            if len(ready) >= batch_size or (ready and not pending and exhausted):
+                batch, ready = ready[:batch_size], ready[batch_size:]
+                # Decoding of the next images carries on while this batch runs
+                try:
+                    probs = cxr.batcher.predict_many([tensor for _, tensor in batch])
+                    records += [probabilities_record(name, p, threshold, cxr.version)
+                                for (name, _), p in zip(batch, probs)]
+                except Exception as e:
+                    records += [{'source': name, 'error': f"Inference failed: {e}"} for name, _ in batch]
+            if records:
+                yield records
+            if exhausted and not pending and not ready:
+                return
+
+
+class Checkpoint:
+    """Append-only list of the image names already written to the output."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.endswith('\n')}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def add(self, names):
+        for name in names:
+            self._file.write(name.replace('\n', ' ') + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(names)
+
+    def close(self):
+        self._file.close()
+
+
+def iter_bulk(source, checkpoint=None, cxr=None, summary=None, **options):
+    """Yield the NDJSON text of each batch of results as it finishes.
+
+    The images of a batch that were analyzed are added to the checkpoint only
+    once the consumer asks for the next batch, i.e. after it has written this
+    one; failed images are left out so a resumed run retries them. The counts of the run are
+    stored in the summary dict, if one is given.
+    """
+    started = time.perf_counter()
+    analyzed = errors = 0
+    skip = frozenset(checkpoint.done) if checkpoint is not None else ()
+    for records in analyze_images(iter_images(source), cxr=cxr, skip=skip, **options):
+        yield ''.join(ndjson_line(record) for record in records)
+        analyzed += len(records)
+        errors += sum('error' in record for record in records)
+        if checkpoint is not None:
+            checkpoint.add([record['source'] for record in records if 'error' not in record])
+
+    if summary is not None:
+        seconds = time.perf_counter() - started
+        summary.update({
+            'images': analyzed,
+            'errors': errors,
+            'skipped': len(skip),
+            'seconds': round(seconds, 2),
+            'images_per_second': round(analyzed / seconds, 2) if seconds > 0 else None,
+        })
+
+
+def run_bulk(source, output, checkpoint=None, cxr=None, **options):
+    """Analyze every image of source, writing NDJSON lines to the output stream; returns a summary."""
+    summary = {}
+    for text in iter_bulk(source, checkpoint, cxr, summary, **options):
+        output.write(text)
+        output.flush()
+    return summary
 
-# Load model
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = torch.load(MODEL_PATH, map_location=device)
-model.eval()
 
 def analyze_chest_xray(image_path, threshold=0.5):
     """Run inference on a chest X-ray image."""
-    img = Image.open(image_path).convert("RGB")
-    img_tensor = transform(img).unsqueeze(0).to(device)
-
-    with torch.no_grad():
-        outputs = model(img_tensor)
-        probs = torch.sigmoid(outputs).cpu().numpy()[0]
-
-    results = []
-    for idx, prob in enumerate(probs):
-        if prob >= threshold:
-            results.append({
-                "condition": CLASS_NAMES[idx],
-                "probability": float(prob)
-            })
-    return results
+    records = [record for batch in analyze_images(iter_images(image_path), threshold=threshold) for record in batch]
+    if not records:
+        raise FileNotFoundError(image_path)
+    if 'error' in records[0]:
+        raise ValueError(records[0]['error'])
+    return records[0]['predictions']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze chest X-rays in bulk, writing NDJSON results.")
+    parser.add_argument('source', help="image, directory, glob pattern, or .tar/.tar.gz/.zip archive")
+    parser.add_argument('--output', help="NDJSON file to append to (default: stdout)")
+    parser.add_argument('--checkpoint', help="resume file (default: <output>.checkpoint when --output is set)")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument('--decode-threads', type=int, default=BULK_DECODE_THREADS)
+    parser.add_argument('--prefetch', type=int, default=BULK_PREFETCH, help="most images decoded ahead of the model")
+    args = parser.parse_args(argv)
+
+    checkpoint_path = args.checkpoint or (f"{args.output}.checkpoint" if args.output else None)
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+    if checkpoint is not None and checkpoint.done:
+        print(f"Resuming: {len(checkpoint.done)} images already done", file=sys.stderr)
+
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        # Model loading messages go to stderr, so NDJSON on stdout stays clean
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = run_bulk(args.source, output, checkpoint, threshold=args.threshold, batch_size=args.batch_size,
+                               decode_threads=args.decode_threads, prefetch=args.prefetch)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if checkpoint is not None:
+            checkpoint.close()
+    print(f"Analyzed {summary['images']} images ({summary['errors']} errors) in {summary['seconds']}s "
+          f"({summary['images_per_second']} images/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
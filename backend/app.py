@@ -1,20 +1,29 @@
+import time
+_startup_started = time.perf_counter()
+
 import os
-import requests
 
 from flask import Flask, request, jsonify
 from flask import Flask, request, jsonify, render_template_string, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import pickle
 import numpy as np
 from PIL import Image
 from PIL import Image, UnidentifiedImageError
 import json
-from torchvision import transforms
-import torch
-import torch.nn as nn
-import torchvision.models as models
 import argparse, json, os, sys, glob
 from pathlib import Path
+from model_registry import ModelRegistry, MODEL_EAGER_WARMUP, load_cxr_model, load_symptom_model
+from image_io import InMemoryUploadRequest, UploadError, MAX_CONTENT_LENGTH, open_image_bytes, read_upload_bytes
+from cxr_preprocess import prepare_decode
+from cxr_batcher import InferenceTimeout
+from result_cache import create_result_cache, image_cache_key, symptom_cache_key
+from gemini_client import GeminiError, gemini_client
+from chat_kb import DEFAULT_CONFIDENCE, chat_kb
+from chat_index import load_retrieval_index
+from metrics import StageTimer, init_metrics
+from profiling import current_torch_trace_path, init_profiling
 
 # Define the chest X-ray classes
 CXR_CLASSES = [
@@ -23,64 +32,57 @@ CXR_CLASSES = [
     'Edema', 'Emphysema', 'Fibrosis', 'Pleural_Thickening', 'Hernia'
 ]
 
-class ChestXRayModel(nn.Module):
-    def __init__(self, num_classes=14):
-        super(ChestXRayModel, self).__init__()
-        self.backbone = models.resnet50(weights=None)  # Using ResNet50 as that matches the state dict
-        in_features = self.backbone.fc.in_features
-        self.backbone.fc = nn.Linear(in_features, num_classes)
-
-    def forward(self, x):
-        return self.backbone(x)
+# Models are loaded on first use (torch is not imported until then)
+model_registry = ModelRegistry()
+model_registry.register('symptom', load_symptom_model)
+model_registry.register('cxr', lambda bundle: load_cxr_model(len(CXR_CLASSES), bundle=bundle))
 
-    
-
-MODEL_PATH = os.path.join("models", "cxr_model.pt")
-CLASS_NAMES_PATH = os.path.join("models", "cxr_class_names.json")
-
-# Set up the device
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-if os.path.exists(MODEL_PATH):
-    NUM_CLASSES = len(CXR_CLASSES)
-    chest_xray_model = ChestXRayModel(num_classes=NUM_CLASSES)
-    state_dict = torch.load(MODEL_PATH, map_location=device)
-    chest_xray_model.load_state_dict(state_dict)
-    chest_xray_model.to(device)
-    chest_xray_model.eval()
-    print("Chest X-Ray model loaded successfully.")
-else:
-    chest_xray_model = None
-    print("Chest X-Ray model not found.")
-
-
-# Preprocessing (must match training!)
-cxr_transform = transforms.Compose([
-    transforms.Resize((320, 320)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225]),
-])
+# Shared by /predict and /analyze-image; keyed by content hash + model version
+result_cache = create_result_cache()
+chat_index = load_retrieval_index()
 
 from auth_simple import (
     init_simple_auth, register_user, authenticate_user, generate_token, 
-    get_user_by_id, require_auth, hash_password, verify_password, SessionLocal
+    get_user_by_id, invalidate_user, require_auth, hash_password, verify_password,
+    get_request_db, init_db_sessions, pool_stats, User
 )
+from password_pool import PoolBusy, PoolSaturated, PoolTimeout
 from reports_routes import init_reports_routes
+from admin_routes import init_admin_routes
+from job_queue import JobQueue
+from jobs_routes import init_jobs_routes
+from bulk_routes import init_bulk_routes
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}}, supports_credentials=True) # Enable CORS for all routes
+# Uploads are decoded from memory; cap the body so that memory stays bounded
+app.request_class = InMemoryUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}}, supports_credentials=True,
+     expose_headers=["X-Next-Cursor"]) # Enable CORS for all routes
 
 # Initialize simple authentication and reports routes
 init_simple_auth()
+init_db_sessions(app)
 app = init_reports_routes(app)
+app = init_admin_routes(app, model_registry)
+app = init_metrics(app, model_registry, result_cache)
+app = init_profiling(app)
+
+
+@app.before_request
+def check_model_version():
+    # Picks up a newly activated model version; loading happens off the request path
+    model_registry.maybe_reload()
+
 
 @app.route('/api/user/profile', methods=['PUT'])
 @require_auth
 def update_profile():
+    db = get_request_db()
     try:
         data = request.json
-        user = get_user_by_id(request.user_id)
+        # Loaded in this request's session, so changes are committed in place
+        user = db.query(User).filter(User.id == request.user_id).first()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -92,24 +94,22 @@ def update_profile():
         # Update password if provided
         if 'oldPassword' in data and 'newPassword' in data:
             if not verify_password(data['oldPassword'], user.password_hash):
+                db.rollback()
                 return jsonify({"error": "Current password is incorrect"}), 400
             user.password_hash = hash_password(data['newPassword'])
             
         # Save changes
-        db = SessionLocal()
-        try:
-            db.merge(user)
-            db.commit()
-            return jsonify({
-                "name": user.username,
-                "email": user.email
-            })
-        except Exception as e:
-            db.rollback()
-            return jsonify({"error": str(e)}), 500
-        finally:
-            db.close()
+        db.commit()
+        invalidate_user(user.id)
+        return jsonify({
+            "name": user.username,
+            "email": user.email
+        })
+    except PoolBusy:
+        db.rollback()
+        raise
     except Exception as e:
+        db.rollback()
         return jsonify({"error": str(e)}), 500
 
 # Load the trained model and related data files
@@ -212,20 +212,6 @@ def home_with_sidebar():
     </html>
     '''
     return render_template_string(page_html, routes=routes)
-try:
-    with open('model.pkl', 'rb') as f:
-        model = pickle.load(f)
-    with open('label_encoder.pkl', 'rb') as f:
-        label_encoder = pickle.load(f)
-    with open('symptom_columns.pkl', 'rb') as f:
-        symptom_columns = pickle.load(f)
-    print("Model and related files loaded successfully!")
-except FileNotFoundError:
-    print("Model files not found. Please run train_model.py first.")
-    model = None
-    label_encoder = None
-    symptom_columns = None
-
 # Disease descriptions
 DISEASE_DESCRIPTIONS = {
     'Common Cold': 'A viral infection of the upper respiratory tract that is usually harmless and resolves on its own.',
@@ -258,16 +244,6 @@ HEALTH_RECOMMENDATIONS = [
     }
 ]
 
-# Medical knowledge base for chatbot
-MEDICAL_KNOWLEDGE = {
-    'fever': 'Fever is a temporary increase in body temperature, often due to an illness. Common causes include infections, heat exhaustion, certain medications, or inflammatory conditions.',
-    'flu': 'Influenza prevention includes annual vaccination, frequent handwashing, avoiding close contact with sick people, and maintaining good health habits.',
-    'diabetes': 'Common diabetes symptoms include increased thirst, frequent urination, extreme fatigue, blurred vision, and unexplained weight loss.',
-    'heart': 'Maintain heart health through regular exercise, balanced diet, limiting sodium, not smoking, managing stress, and regular check-ups.',
-    'immunity': 'Immunity-boosting foods include citrus fruits, garlic, ginger, spinach, yogurt, almonds, turmeric, and green tea.',
-    'water': 'General recommendation is about 8 glasses (64 ounces) of water daily, but needs vary based on activity and climate.'
-}
-
 # Image analysis mock conditions
 IMAGE_CONDITIONS = {
     'pneumonia': {'name': 'Pneumonia', 'description': 'Inflammation of the lungs, typically caused by bacterial or viral infection.'},
@@ -279,13 +255,74 @@ IMAGE_CONDITIONS = {
 
 def preprocess_symptoms(user_symptoms):
     """Convert user symptoms list to a binary vector for the model input."""
-    symptom_vector = np.zeros(len(symptom_columns))
-    normalized_user_symptoms = [s.lower().replace(' ', '_') for s in user_symptoms]
+    return preprocess_symptoms_batch([user_symptoms])
+
+def preprocess_symptoms_batch(symptom_lists):
+    """Convert N user symptom lists to an N x F binary matrix for the model input."""
+    return model_registry.get('symptom').symptom_index.vectorize_batch(symptom_lists)
+
+def predict_symptoms_batch(symptom_lists, top_k=3, timer=None):
+    """Run the symptom model once over N symptom lists.
+
+    Returns one {'predictions', 'recommendations'} dict per input list, in the
+    same shape as the /predict response. Stages are recorded on timer if given.
+    """
+    if not symptom_lists:
+        return []
+    timer = timer or StageTimer()
+
+    symptom_model = model_registry.get('symptom')
+    symptom_index = symptom_model.symptom_index
+
+    # The model only sees which columns are set, so the resolved column set is the cache key
+    cache_version = f"{symptom_model.version}:top{top_k}"
+    keys = [symptom_cache_key(map(str, symptom_index.resolve(s)), cache_version) for s in symptom_lists]
+    top_predictions = [result_cache.get(key) for key in keys]
+    missing_rows = [row for row, cached in enumerate(top_predictions) if cached is None]
+    timer.mark('cache_lookup')
+
+    if missing_rows:
+        X = symptom_index.vectorize_batch([symptom_lists[row] for row in missing_rows])
+        timer.mark('vectorize')
+        probabilities = symptom_model.predict_proba(X)
+        timer.mark('predict_proba')
+        k = min(top_k, probabilities.shape[1])
+
+        # Top-k per row without a full sort, then order just those k columns
+        top_indices = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+        top_probs = np.take_along_axis(probabilities, top_indices, axis=1)
+        order = np.argsort(-top_probs, axis=1, kind='stable')
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_probs = np.take_along_axis(top_probs, order, axis=1)
+        diseases = symptom_model.disease_labels[top_indices]
+
+        for i, row in enumerate(missing_rows):
+            top = [[str(disease), round(float(prob * 100), 1)] for disease, prob in zip(diseases[i], top_probs[i])]
+            result_cache.set(keys[row], top)
+            top_predictions[row] = top
+        timer.mark('top_k_labels')
+
+    results = []
+    for user_symptoms, top in zip(symptom_lists, top_predictions):
+        # Find matching symptoms in the disease symptom list - simplified as symptom matches in user input
+        matching_symptoms = symptom_index.matching_symptoms(user_symptoms)
+
+        predictions = []
+        for disease, confidence in top:
+            predictions.append({
+                'disease': disease,
+                'confidence': confidence,
+                'description': DISEASE_DESCRIPTIONS.get(disease, 'No description available.'),
+                'matchingSymptoms': matching_symptoms
+            })
 
-    for i, symptom_col in enumerate(symptom_columns):
-        if symptom_col.lower() in normalized_user_symptoms:
-            symptom_vector[i] = 1
-    return symptom_vector.reshape(1, -1)
+        results.append({
+            'predictions': predictions,
+            'recommendations': HEALTH_RECOMMENDATIONS,
+            'modelVersion': symptom_model.version
+        })
+    timer.mark('response')
+    return results
 
 @app.route('/')
 def home():
@@ -293,7 +330,8 @@ def home():
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    if model is None:
+    timer = StageTimer()
+    if model_registry.get('symptom') is None:
         return jsonify({'error': 'Model not loaded. Please train the model first.'}), 500
 
     data = request.get_json()
@@ -303,29 +341,39 @@ def predict():
         return jsonify({'error': 'No symptoms provided or incorrect format.'}), 400
 
     try:
-        symptom_vector = preprocess_symptoms(user_symptoms)
-        probabilities = model.predict_proba(symptom_vector)[0]
-        top_indices = np.argsort(probabilities)[-3:][::-1]
+        return jsonify(predict_symptoms_batch([user_symptoms], timer=timer)[0])
 
-        predictions = []
-        for idx in top_indices:
-            disease = label_encoder.inverse_transform([idx])[0]
-            confidence = float(probabilities[idx] * 100)
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
-            # Find matching symptoms in the disease symptom list - simplified as symptom matches in user input
-            matching_symptoms = [s for s in user_symptoms if s.lower().replace(' ', '_') in symptom_columns]
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    if model_registry.get('symptom') is None:
+        return jsonify({'error': 'Model not loaded. Please train the model first.'}), 500
 
-            predictions.append({
-                'disease': disease,
-                'confidence': round(confidence, 1),
-                'description': DISEASE_DESCRIPTIONS.get(disease, 'No description available.'),
-                'matchingSymptoms': matching_symptoms
-            })
+    data = request.get_json()
+    items = data.get('items', []) if isinstance(data, dict) else []
+
+    if not items or not isinstance(items, list):
+        return jsonify({'error': 'No items provided or incorrect format.'}), 400
+
+    # Invalid entries are reported in place; the rest go through one model call
+    results = [None] * len(items)
+    valid_positions = []
+    valid_symptom_lists = []
+    for pos, item in enumerate(items):
+        user_symptoms = item.get('symptoms', []) if isinstance(item, dict) else item
+        if not user_symptoms or not isinstance(user_symptoms, list):
+            results[pos] = {'error': 'No symptoms provided or incorrect format.'}
+            continue
+        valid_positions.append(pos)
+        valid_symptom_lists.append(user_symptoms)
 
-        return jsonify({
-            'predictions': predictions,
-            'recommendations': HEALTH_RECOMMENDATIONS
-        })
+    try:
+        for pos, result in zip(valid_positions, predict_symptoms_batch(valid_symptom_lists)):
+            results[pos] = result
+
+        return jsonify({'results': results})
 
     except Exception as e:
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
@@ -342,46 +390,34 @@ def chat():
     confidence = 85
     sources = ['Medical Knowledge Base']
 
-    # Lookup simple keyword answers
-    for keyword, response in MEDICAL_KNOWLEDGE.items():
-        if keyword in question:
-            answer = response
-            break
+    # Single pass over the question finds every knowledge base intent it mentions
+    match = chat_kb.match(question)
+    if match.intent is not None:
+        answer = match.intent['answer']
+        confidence = match.intent.get('confidence', DEFAULT_CONFIDENCE)
 
-    # If no direct answer, fallback to generic advice
-    if answer is None:
-        if any(x in question for x in ['pain', 'hurt']):
-            answer = "Pain can have many causes. For persistent or severe pain, consult with a healthcare provider for proper evaluation and treatment."
-        elif any(x in question for x in ['diet', 'nutrition']):
-            answer = "A balanced diet includes fruits, vegetables, whole grains, lean proteins, and healthy fats. Limit processed foods and excessive sugar."
-        elif any(x in question for x in ['exercise', 'workout']):
-            answer = "Regular physical activity is crucial for health. Aim for at least 150 minutes of moderate-intensity exercise weekly."
+    # Paraphrases no keyword catches (or only a low-confidence intent) get the closest answer by TF-IDF cosine
+    if chat_index is not None and (answer is None or confidence < DEFAULT_CONFIDENCE):
+        retrieved, score = chat_index.best_answer(question)
+        if retrieved is not None:
+            answer = retrieved
+            confidence = min(DEFAULT_CONFIDENCE, round(40 + score * 75))
 
     # If still no answer, and Gemini API key active, call Gemini API (optional)
     if answer is None:
-        gemini_api_key = os.environ.get('GEMINI_API_KEY')
-        gemini_url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent'
-        if gemini_api_key:
+        if gemini_client.enabled:
             try:
-                headers = {'Content-Type': 'application/json'}
-                params = {'key': gemini_api_key}
-                payload = {
-                    'contents': [{'parts': [{'text': question}]}]
-                }
-                response = requests.post(gemini_url, headers=headers, params=params, json=payload, timeout=10)
-                if response.status_code == 200:
-                    gemini_data = response.json()
-                    gemini_answer = gemini_data.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-                    if gemini_answer:
-                        answer = gemini_answer
-                        confidence = 70
-                        sources = ['Gemini API']
-                    else:
-                        answer = "Sorry, I couldn't find an answer to your question."
-                        confidence = 0
+                gemini_answer = gemini_client.ask(question)
+                if gemini_answer:
+                    answer = gemini_answer
+                    confidence = 70
+                    sources = ['Gemini API']
                 else:
-                    answer = "Sorry, there was a problem contacting the Gemini API."
+                    answer = "Sorry, I couldn't find an answer to your question."
                     confidence = 0
+            except GeminiError:
+                answer = "Sorry, there was a problem contacting the Gemini API."
+                confidence = 0
             except Exception as e:
                 answer = f"Gemini API error: {str(e)}"
                 confidence = 0
@@ -390,11 +426,8 @@ def chat():
             answer = "Sorry, I don't have an answer for that at the moment."
 
     # Add medical disclaimer if question is health related
-    health_keywords = ['health', 'doctor', 'medicine', 'medical', 'symptom', 'treatment', 'disease', 'pain', 'diet',
-                       'nutrition', 'exercise', 'workout', 'fever', 'flu', 'diabetes', 'heart', 'immunity', 'water']
-
-    if any(hw in question for hw in health_keywords):
-        answer += "\n\nRemember: Always consult healthcare professionals for personalized medical advice."
+    if match.disclaimer:
+        answer += "\n\n" + chat_kb.disclaimer
 
     return jsonify({
         'answer': answer,
@@ -402,8 +435,72 @@ def chat():
         'sources': sources
     })
 
+CXR_RECOMMENDATIONS = [
+    "Consult with a qualified radiologist for interpretation",
+    "Consider follow-up imaging if symptoms persist",
+    "Discuss results with your healthcare provider"
+]
+
+def cxr_predictions(probs):
+    """Conditions at or above the threshold, or the top 3 when none pass it."""
+    # Collect predictions above threshold
+    predictions = []
+    for idx, prob in enumerate(probs):
+        if prob >= 0.5:  # adjustable threshold
+            predictions.append({
+                "condition": CXR_CLASSES[idx],
+                "confidence": round(float(prob) * 100, 2)
+            })
+
+    # If nothing passes threshold, return top 3
+    if not predictions:
+        top_indices = probs.argsort()[-3:][::-1]
+        for idx in top_indices:
+            predictions.append({
+                "condition": CXR_CLASSES[idx],
+                "confidence": round(float(probs[idx]) * 100, 2)
+            })
+    return predictions
+
+def analyze_study(job):
+    """Job handler: analyze every image of a study, sharing batched forward passes."""
+    timer = StageTimer('analyze_image_job')
+    cxr = model_registry.get('cxr')
+    if cxr is None:
+        raise RuntimeError("Chest X-ray model not loaded.")
+    timer.mark('load_model')
+
+    images = job.payload['images']
+    tensors = []
+    for image in images:
+        with open(job_queue.image_path(image), 'rb') as f:
+            image_bytes = f.read()
+        tensors.append(cxr.transform(open_image_bytes(image_bytes, prepare=prepare_decode)))
+    timer.mark('decode')
+
+    probs = cxr.batcher.predict_many(tensors)
+    timer.mark('inference')
+
+    # A finding in any view is a finding of the study
+    result = {
+        "images": [{"filename": image['filename'], "predictions": cxr_predictions(image_probs)}
+                   for image, image_probs in zip(images, probs)],
+        "study": {"predictions": cxr_predictions(np.max(np.stack(probs), axis=0))},
+        "recommendations": CXR_RECOMMENDATIONS,
+        "modelVersion": cxr.version,
+        "processingTime": timer.elapsed_ms()
+    }
+    timer.mark('postprocess')
+    return result
+
+# Multi-image studies and slow analyses run here, off the request threads
+job_queue = JobQueue(analyze_study)
+app = init_jobs_routes(app, job_queue)
+app = init_bulk_routes(app, model_registry)
+
 @app.route('/analyze-image', methods=['POST'])
 def analyze_image():
+    timer = StageTimer()
     try:
         if 'image' not in request.files:
             return jsonify({"error": "No image file provided."}), 400
@@ -412,124 +509,87 @@ def analyze_image():
         if image_file.filename == '':
             return jsonify({"error": "No image file selected."}), 400
 
-        # Save uploaded file temporarily
-        save_path = os.path.join("uploads", image_file.filename)
-        os.makedirs("uploads", exist_ok=True)
-        image_file.save(save_path)
+        # Read straight from the request buffer; oversized or non-image uploads fail fast
+        try:
+            image_bytes = read_upload_bytes(image_file)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status_code
+        timer.mark('read_upload')
 
         # Check if chest X-ray model is loaded
-        if chest_xray_model is None:
+        cxr = model_registry.get('cxr')
+        if cxr is None:
             return jsonify({"error": "Chest X-ray model not loaded."}), 500
+        timer.mark('load_model')
 
-        # Preprocess and predict
-        from PIL import Image
-        img = Image.open(save_path).convert("RGB")
-        img_tensor = cxr_transform(img).unsqueeze(0).to(device)
+        # Re-submitted images are answered without decoding or a forward pass
+        cache_key = image_cache_key(image_bytes, cxr.version)
+        cached = result_cache.get(cache_key)
+        timer.mark('cache_lookup')
+        if cached is not None:
+            return jsonify({**cached, "processingTime": timer.elapsed_ms()})
 
-        with torch.no_grad():
-            outputs = chest_xray_model(img_tensor)
-            probs = torch.sigmoid(outputs).cpu().numpy()[0]
+        try:
+            img = open_image_bytes(image_bytes, prepare=prepare_decode)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status_code
+        timer.mark('decode')
 
-        # Collect predictions above threshold
-        predictions = []
-        for idx, prob in enumerate(probs):
-            if prob >= 0.5:  # adjustable threshold
-                predictions.append({
-                    "condition": CXR_CLASSES[idx],
-                    "confidence": round(float(prob) * 100, 2)
-                })
-
-        # If nothing passes threshold, return top 3
-        if not predictions:
-            top_indices = probs.argsort()[-3:][::-1]
-            for idx in top_indices:
-                predictions.append({
-                    "condition": CXR_CLASSES[idx],
-                    "confidence": round(float(probs[idx]) * 100, 2)
-                })
+        # Preprocess and predict
+        img_tensor = cxr.transform(img)
+        timer.mark('transform')
 
-        return jsonify({
-            "predictions": predictions,
-            "recommendations": [
-                "Consult with a qualified radiologist for interpretation",
-                "Consider follow-up imaging if symptoms persist",
-                "Discuss results with your healthcare provider"
-            ]
-        })
+        # Queued with concurrent uploads and run as a single batched forward pass
+        probs = cxr.batcher.predict(img_tensor, trace_path=current_torch_trace_path())
+        timer.mark('inference')
 
+        result = {
+            "predictions": cxr_predictions(probs),
+            "recommendations": CXR_RECOMMENDATIONS,
+            "modelVersion": cxr.version
+        }
+        result_cache.set(cache_key, result)
+        timer.mark('postprocess')
+        # Measured for this request, so never part of the cached result
+        return jsonify({**result, "processingTime": timer.elapsed_ms()})
+
+    except RequestEntityTooLarge:
+        # Body over MAX_CONTENT_LENGTH; answered by the 413 handler below
+        raise
+    except InferenceTimeout as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
     except Exception as e:
         return jsonify({"error": f"Image analysis failed: {str(e)}"}), 500
 
-    try:
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided.'}), 400
-
-        image_file = request.files['image']
-        if image_file.filename == '':
-            return jsonify({'error': 'No image file selected.'}), 400
+@app.errorhandler(PoolSaturated)
+def password_pool_saturated(e):
+    response = jsonify({"error": str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 429
 
-        # Save uploaded file temporarily
-        save_path = os.path.join("uploads", image_file.filename)
-        os.makedirs("uploads", exist_ok=True)
-        image_file.save(save_path)
+@app.errorhandler(PoolTimeout)
+def password_pool_timeout(e):
+    response = jsonify({"error": str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
-        # Process image with the model
-        try:
-            img = Image.open(save_path).convert("RGB")
-            img_tensor = cxr_transform(img).unsqueeze(0).to(device)
-
-            with torch.no_grad():
-                outputs = chest_xray_model(img_tensor)
-                probs = torch.sigmoid(outputs).cpu().numpy()[0]
-
-            # Collect predictions above threshold
-            predictions = []
-            for idx, prob in enumerate(probs):
-                if prob >= 0.5:  # adjustable threshold
-                    predictions.append({
-                        "condition": CXR_CLASSES[idx],
-                        "confidence": round(float(prob) * 100, 2),
-                        "description": f"Detected {CXR_CLASSES[idx]} with high confidence."
-                    })
-
-            # If nothing passes threshold, return top 3
-            if not predictions:
-                top_indices = probs.argsort()[-3:][::-1]
-                for idx in top_indices:
-                    predictions.append({
-                        "condition": CXR_CLASSES[idx],
-                        "confidence": round(float(probs[idx]) * 100, 2),
-                        "description": f"Possible {CXR_CLASSES[idx]} detected."
-                    })
-        except Exception as e:
-            return jsonify({'error': f'Image processing failed: {str(e)}'}), 500
-        finally:
-            # Clean up temporary file
-            if os.path.exists(save_path):
-                os.remove(save_path)
-        # Sort predictions by confidence
-        predictions = sorted(predictions, key=lambda x: x['confidence'], reverse=True)
-
-        recommendations = [
-            'Consult with a qualified radiologist for professional interpretation',
-            'Consider additional imaging or tests if symptoms persist',
-            'Follow up with your healthcare provider to discuss results'
-        ]
-
-        return jsonify({
-            'predictions': predictions[:3],
-            'recommendations': recommendations,
-            'processingTime': 3500  # in milliseconds
-        })
-
-    except Exception as e:
-        return jsonify({'error': f'Image analysis failed: {str(e)}'}), 500
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": "Upload exceeds the maximum allowed size."}), 413
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None
+        'model_loaded': model_registry.is_loaded('symptom'),
+        'startup': model_registry.report(),
+        'cache': result_cache.stats(),
+        'database': pool_stats(),
+        'gemini': gemini_client.stats(),
+        'chat_kb': chat_kb.stats(),
+        'jobs': job_queue.stats()
     })
 
 # Authentication endpoints
@@ -594,5 +654,10 @@ def get_current_user():
             "email": user.email
         }
     })
+if MODEL_EAGER_WARMUP:
+    model_registry.warmup()
+print(f"Startup completed in {model_registry.mark_started(_startup_started):.2f}s "
+      f"({'models warmed up' if MODEL_EAGER_WARMUP else 'models load on first use'})")
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,14 @@
+"""
+Latency benchmarks for the API hot paths.
+
+The Flask app is driven in-process through its test client (no network),
+against a throwaway SQLite user database, with synthetic symptom sets,
+X-ray-sized images and chat questions. Every endpoint reports p50/p95/p99
+latency, throughput and peak RSS; results can be written as JSON and
+compared with an earlier run.
+
+Run from the backend directory:
+    python -m benchmarks
+    python -m benchmarks --endpoints predict,analyze_image --requests 500
+    python -m benchmarks --concurrency 1,2,4,8 --mode processes --output after.json --compare before.json
+"""
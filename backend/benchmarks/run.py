@@ -0,0 +1,305 @@
+"""
+Benchmark runner: drives each scenario through the Flask test client and
+reports latency percentiles, throughput and peak RSS.
+
+In --mode threads every concurrent client is a thread of this process, the
+way gthread workers share one app. In --mode processes the app is imported
+once and clients are forked from it, like gunicorn workers with
+preload_app, so the numbers show how throughput scales with worker count.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_ENDPOINTS = ('predict', 'predict_batch', 'chat', 'analyze_image', 'auth_me', 'auth_login')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def configure_environment(workdir, use_cache=False):
+    """Point the app at a throwaway SQLite database and keep it off the network.
+
+    Must run before the app is imported: its modules read their settings at import time.
+    Anything the benchmark writes to is overridden, even when it is already set in the
+    environment: it signs up users and logs in as the default admin.
+    """
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['GEMINI_API_KEY'] = ''
+    os.environ.setdefault('MODEL_STORE_DIR', os.path.join(workdir, 'model_store'))
+    # The app builds its job queue and chat index on import; keep both out of the real tree
+    os.environ['JOB_QUEUE_DB'] = os.path.join(workdir, 'jobs.sqlite3')
+    os.environ['JOB_DATA_DIR'] = os.path.join(workdir, 'jobs')
+    os.environ['CHAT_INDEX_DIR'] = os.path.join(workdir, 'chat_index')
+    if not use_cache:
+        # Every payload differs from the one before it, so a one-entry cache always misses
+        os.environ['RESULT_CACHE_MAX_ENTRIES'] = '1'
+        os.environ['RESULT_CACHE_DIR'] = ''
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RSSSampler:
+    """Highest resident set size seen while the block runs, sampled from a background thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def run_client(app, scenario, indexes, token, warmup):
+    """Send the given requests in order; return (latencies in seconds, status counts, first error)."""
+    client = app.test_client()
+    for i in range(warmup):
+        client.open(scenario.path, method=scenario.method, **scenario.request_kwargs(i, token))
+
+    latencies, statuses, error = [], {}, None
+    for i in indexes:
+        kwargs = scenario.request_kwargs(i, token)
+        started = time.perf_counter()
+        response = client.open(scenario.path, method=scenario.method, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code >= 400 and error is None:
+            error = (response.get_json(silent=True) or {}).get('error', response.status)
+    return latencies, statuses, error
+
+
+def run_threads(app, scenario, total, concurrency, token, warmup):
+    shares = [range(worker, total, concurrency) for worker in range(concurrency)]
+    results = [None] * concurrency
+    # Warm-up happens before the barrier so only measured requests count towards wall time
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(n):
+        client_warmup = warmup if n == 0 else 0
+        run_client(app, scenario, [], token, client_warmup)
+        barrier.wait()
+        results[n] = run_client(app, scenario, shares[n], token, 0)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    with RSSSampler() as rss:
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+    return results, wall, [rss.peak]
+
+
+def _process_worker(app, scenario, indexes, token, warmup, barrier, queue):
+    from auth_simple import dispose_pool_after_fork
+    dispose_pool_after_fork()
+    try:
+        run_client(app, scenario, [], token, warmup)
+        barrier.wait()
+        with RSSSampler() as rss:
+            result = run_client(app, scenario, indexes, token, 0)
+        queue.put((result, rss.peak))
+    except Exception as e:
+        queue.put((([], {}, f"{type(e).__name__}: {e}"), current_rss_bytes()))
+
+
+def run_processes(app, scenario, total, concurrency, token, warmup):
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(concurrency + 1)
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_process_worker,
+                        args=(app, scenario, range(worker, total, concurrency), token, warmup, barrier, queue))
+        for worker in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    started = time.perf_counter()
+    collected = [queue.get() for _ in processes]
+    wall = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return [result for result, _ in collected], wall, [peak for _, peak in collected]
+
+
+def summarize(name, mode, concurrency, results, wall, peaks):
+    latencies = np.array([latency for result in results for latency in result[0]]) * 1000
+    statuses = {}
+    for _, counts, _ in results:
+        for status, count in counts.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    errors = [error for _, _, error in results if error]
+
+    summary = {
+        'endpoint': name,
+        'mode': mode,
+        'concurrency': concurrency,
+        'requests': int(latencies.size),
+        'errors': sum(count for status, count in statuses.items() if int(status) >= 400),
+        'statuses': statuses,
+        'throughput_rps': round(latencies.size / wall, 2) if wall > 0 else None,
+        'peak_rss_mb': round(max(peaks) / (1024 * 1024), 1),
+    }
+    if latencies.size:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary['latency_ms'] = {
+            'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3),
+            'mean': round(float(latencies.mean()), 3), 'max': round(float(latencies.max()), 3),
+        }
+    if errors:
+        summary['first_error'] = str(errors[0])
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_summary(summary):
+    latency = summary.get('latency_ms')
+    if latency is None:
+        print(f"{summary['endpoint']:<14} x{summary['concurrency']:<3} skipped: {summary.get('first_error')}")
+        return
+    print(f"{summary['endpoint']:<14} x{summary['concurrency']:<3} "
+          f"p50 {latency['p50']:>9.2f}ms  p95 {latency['p95']:>9.2f}ms  p99 {latency['p99']:>9.2f}ms  "
+          f"{summary['throughput_rps']:>9.1f} req/s  rss {summary['peak_rss_mb']:>7.1f}MB  "
+          f"errors {summary['errors']}")
+
+
+def compare(results, baseline_path):
+    """Print the change in p50, p95 and throughput against an earlier JSON report."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['endpoint'], r['mode'], r['concurrency']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}:")
+    matched = 0
+    for result in results:
+        before = baseline.get((result['endpoint'], result['mode'], result['concurrency']))
+        if not before or 'latency_ms' not in before or 'latency_ms' not in result:
+            continue
+        matched += 1
+        changes = []
+        for key in ('p50', 'p95'):
+            old, new = before['latency_ms'][key], result['latency_ms'][key]
+            changes.append(f"{key} {(new - old) / old * 100 if old else 0:+6.1f}%")
+        old, new = before['throughput_rps'], result['throughput_rps']
+        changes.append(f"throughput {(new - old) / old * 100 if old else 0:+6.1f}%")
+        print(f"{result['endpoint']:<14} x{result['concurrency']:<3} " + "  ".join(changes))
+    if not matched:
+        print("No results with the same endpoint, mode and concurrency.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Benchmark the API hot paths in-process.")
+    parser.add_argument('--endpoints', default=','.join(DEFAULT_ENDPOINTS),
+                        help=f"comma-separated subset of: {', '.join(DEFAULT_ENDPOINTS)}")
+    parser.add_argument('--requests', type=int, default=200, help="measured requests per endpoint and concurrency level")
+    parser.add_argument('--warmup', type=int, default=5, help="unmeasured requests per endpoint first")
+    parser.add_argument('--concurrency', default='1', help="comma-separated client counts, e.g. 1,2,4,8")
+    parser.add_argument('--mode', choices=('threads', 'processes'), default='threads')
+    parser.add_argument('--image-size', type=int, default=1024, help="side of the generated X-ray images in pixels")
+    parser.add_argument('--cache', action='store_true', help="leave the result cache on (off by default)")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(DEFAULT_ENDPOINTS))
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='benchmarks-')
+    configure_environment(workdir, args.cache)
+    try:
+        return run_benchmarks(args, names, levels)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(args, names, levels):
+    from app import app
+    from benchmarks.workloads import build_scenarios
+    scenarios = build_scenarios(image_size=args.image_size)
+
+    client = app.test_client()
+    login = scenarios['auth_login'].request_kwargs(0)
+    token = client.post('/auth/login', **login).get_json()['token']
+
+    runner = run_threads if args.mode == 'threads' else run_processes
+    results = []
+    print(f"Benchmarking {', '.join(names)} ({args.requests} requests, mode {args.mode})")
+    for name in names:
+        scenario = scenarios[name]
+        total = min(args.requests, scenario.max_requests or args.requests)
+        for concurrency in levels:
+            outcome, wall, peaks = runner(app, scenario, total, concurrency, token, args.warmup)
+            summary = summarize(name, args.mode, concurrency, outcome, wall, peaks)
+            # An endpoint whose model is missing answers every request with a 500
+            if summary['statuses'].get('500') == summary['requests']:
+                summary.pop('latency_ms', None)
+            results.append(summary)
+            print_summary(summary)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'process_peak_rss_mb': round(peak_rss_bytes() / (1024 * 1024), 1),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to '{args.output}'")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
@@ -0,0 +1,104 @@
+"""
+Synthetic request payloads and the endpoint scenarios built from them.
+
+Payloads are generated once, before timing starts, and reused round-robin.
+"""
+import io
+import json
+import os
+import pickle
+import random
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Phrases that match nothing locally, so /chat takes its full fallback path
+UNMATCHED_QUESTIONS = [
+    'how long does a broken toe take to heal',
+    'is it safe to fly after surgery',
+    'what vaccines do adults need',
+    'can stress cause hair loss',
+]
+
+
+class Scenario:
+    """One endpoint under test: how to build its i-th request."""
+
+    def __init__(self, name, method, path, payloads, build, max_requests=None, auth=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.payloads = payloads
+        self.build = build
+        self.max_requests = max_requests
+        self.auth = auth
+
+    def request_kwargs(self, i, token=None):
+        kwargs = self.build(self.payloads[i % len(self.payloads)])
+        if self.auth:
+            kwargs['headers'] = {'Authorization': f'Bearer {token}'}
+        return kwargs
+
+
+def symptom_sets(count, seed=0):
+    """Random 2-6 symptom lists, some written with spaces as users type them."""
+    with open(os.path.join(BACKEND_DIR, 'symptom_columns.pkl'), 'rb') as f:
+        columns = list(pickle.load(f))
+    rng = random.Random(seed)
+    sets = []
+    for _ in range(count):
+        symptoms = rng.sample(columns, rng.randint(2, min(6, len(columns))))
+        sets.append([s.replace('_', ' ') if rng.random() < 0.5 else s for s in symptoms])
+    return sets
+
+
+def chat_questions(seed=0):
+    """Knowledge base paraphrases plus questions that fall through to the fallback answer."""
+    with open(os.path.join(BACKEND_DIR, 'chat_knowledge.json'), 'r') as f:
+        intents = json.load(f)['intents']
+    questions = [q for intent in intents for q in intent.get('questions', [])]
+    questions += UNMATCHED_QUESTIONS
+    random.Random(seed).shuffle(questions)
+    return questions
+
+
+def xray_image(size=1024, seed=0, quality=90):
+    """JPEG bytes of a grayscale chest-radiograph-sized image: bright body, dark lungs, noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[-1:1:complex(size), -1:1:complex(size)]
+    body = np.clip(1.2 - (x ** 2 + (y * 0.8) ** 2), 0, 1)
+    lungs = np.exp(-(((np.abs(x) - 0.35) / 0.22) ** 2 + (y / 0.55) ** 2))
+    pixels = 200 * body - 120 * lungs + rng.normal(0, 12, (size, size))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode='L')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_scenarios(pool_size=64, image_size=1024, batch_size=32, seed=0):
+    """All benchmark scenarios by name; distinct payloads keep the result cache from answering."""
+    from auth_simple import DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_PASSWORD
+
+    symptoms = symptom_sets(pool_size, seed)
+    images = [xray_image(image_size, seed + i) for i in range(max(2, pool_size // 4))]
+    batches = [symptom_sets(batch_size, seed + i) for i in range(max(2, pool_size // 8))]
+
+    def image_upload(image_bytes):
+        return {'data': {'image': (io.BytesIO(image_bytes), 'xray.jpg')}, 'content_type': 'multipart/form-data'}
+
+    scenarios = [
+        Scenario('predict', 'POST', '/predict', symptoms,
+                 lambda symptoms: {'json': {'symptoms': symptoms}}),
+        Scenario('predict_batch', 'POST', '/predict/batch', batches,
+                 lambda batch: {'json': {'items': [{'symptoms': s} for s in batch]}}),
+        Scenario('chat', 'POST', '/chat', chat_questions(seed),
+                 lambda question: {'json': {'question': question}}),
+        Scenario('analyze_image', 'POST', '/analyze-image', images, image_upload),
+        Scenario('auth_me', 'GET', '/auth/me', [None], lambda _: {}, auth=True),
+        # bcrypt dominates; a few dozen requests are enough to see a change
+        Scenario('auth_login', 'POST', '/auth/login', [None],
+                 lambda _: {'json': {'email': DEFAULT_ADMIN_EMAIL, 'password': DEFAULT_ADMIN_PASSWORD}}, max_requests=40),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
@@ -0,0 +1,71 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+from flask import Response, jsonify, request, stream_with_context
+
+from analyze_image import Checkpoint, iter_bulk
+from auth_simple import require_admin
+
+# Server-side directories, globs and archives are only read below this root; unset disables them
+BULK_ANALYSIS_ROOT = os.environ.get('BULK_ANALYSIS_ROOT', '')
+BULK_CHECKPOINT_DIR = os.environ.get('BULK_CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'medical-api-bulk'))
+
+
+def _server_source(source):
+    """source resolved below BULK_ANALYSIS_ROOT, or None when it would point anywhere else."""
+    if not BULK_ANALYSIS_ROOT or os.path.isabs(source) or '..' in source.replace('\\', '/').split('/'):
+        return None
+    return os.path.join(os.path.realpath(BULK_ANALYSIS_ROOT), source)
+
+
+def _checkpoint_path(source):
+    return os.path.join(BULK_CHECKPOINT_DIR, f"{hashlib.sha1(source.encode('utf-8')).hexdigest()}.checkpoint")
+
+
+def init_bulk_routes(app, model_registry):
+    @app.route('/analyze-image/bulk', methods=['POST'])
+    @require_admin
+    def analyze_images_bulk():
+        """Stream NDJSON results for an uploaded archive, or a directory, glob or archive under BULK_ANALYSIS_ROOT."""
+        archive = request.files.get('archive')
+        data = request.form if archive is not None else (request.get_json(silent=True) or {})
+        try:
+            threshold = float(data.get('threshold', 0.5))
+        except (TypeError, ValueError):
+            return jsonify({"error": "threshold must be a number"}), 400
+
+        checkpoint = None
+        if archive is not None:
+            # Copied out of the request: its files are closed before the response is streamed
+            source = io.BytesIO(archive.read())
+        else:
+            name = data.get('source')
+            if not name:
+                return jsonify({"error": "Upload an 'archive' or give a 'source' path"}), 400
+            source = _server_source(name)
+            if source is None:
+                return jsonify({"error": "source must be a relative path under BULK_ANALYSIS_ROOT"}), 400
+            if data.get('resume'):
+                checkpoint = Checkpoint(_checkpoint_path(source))
+
+        cxr = model_registry.get('cxr')
+        if cxr is None:
+            if checkpoint is not None:
+                checkpoint.close()
+            return jsonify({"error": "Chest X-ray model not available"}), 503
+
+        def generate():
+            summary = {}
+            try:
+                yield from iter_bulk(source, checkpoint, cxr, summary, threshold=threshold)
+                yield json.dumps({'summary': summary}) + '\n'
+            finally:
+                if checkpoint is not None:
+                    checkpoint.close()
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    return app
@@ -0,0 +1,282 @@
+"""
+TF-IDF retrieval index for chatbot answers.
+
+Built from the chatbot knowledge base (each intent's keywords, example
+questions and answer) plus an optional JSONL corpus of
+{"question": ..., "answer": ...} lines. Unigrams and bigrams are weighted
+with smoothed IDF, each document vector is L2-normalized, and the matrix is
+stored term-major (an inverted index) as plain .npy files that are
+memory-mapped at load time, so every worker shares the same pages.
+
+Each build goes to a subdirectory of CHAT_INDEX_DIR named after a hash of
+its sources, so an index is never stale: when the knowledge base or corpus
+file changes (checked like the knowledge base, every CHAT_KB_RELOAD_SECONDS)
+the matching index is built, or reused if another worker already built it,
+and swapped in.
+
+At query time only the posting lists of the question's terms are touched,
+and the best cosine match is returned if it clears CHAT_RETRIEVAL_THRESHOLD.
+
+Build ahead of time (optional) with:
+    python chat_index.py [chat_knowledge.json] [corpus.jsonl] [chat_index/]
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from chat_kb import CHAT_KB_PATH, CHAT_KB_RELOAD_SECONDS, tokenize
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHAT_INDEX_DIR = os.environ.get('CHAT_INDEX_DIR', os.path.join(BASE_DIR, 'chat_index'))
+CHAT_CORPUS_PATH = os.environ.get('CHAT_CORPUS_PATH', '')
+CHAT_RETRIEVAL_THRESHOLD = float(os.environ.get('CHAT_RETRIEVAL_THRESHOLD', 0.3))
+
+_BUILD_NAME = re.compile(r'^[0-9a-f]{16}$')
+
+# Run through the same tokenizer as questions, so plural folding applies to them too
+STOP_WORDS = frozenset(tokenize("""
+a about after all am an and any are as at be been being but by can could did do does doing for from
+get had has have having he her how i if in into is it its me my of on or our she should so some than
+that the their them then there these they this those to too up was we were what when where which who
+why will with would you your
+"""))
+
+
+def terms(text):
+    """Unigrams (minus stop words) and bigrams of the normalized tokens."""
+    tokens = [token for token in tokenize(text) if token not in STOP_WORDS]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def load_documents(kb_path=CHAT_KB_PATH, corpus_path=CHAT_CORPUS_PATH):
+    """Return [(text, answer, source_id)] from the knowledge base and the optional corpus."""
+    documents = []
+    with open(kb_path, 'r') as f:
+        kb = json.load(f)
+    for intent in kb.get('intents', []):
+        # One document per example question, and one for the intent as a whole
+        for question in intent.get('questions', []):
+            documents.append((question, intent['answer'], intent.get('id', '')))
+        text = ' '.join(intent.get('keywords', []) + [intent['answer']])
+        documents.append((text, intent['answer'], intent.get('id', '')))
+
+    if corpus_path and os.path.exists(corpus_path):
+        with open(corpus_path, 'r') as f:
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    row = json.loads(line)
+                    documents.append((row['question'], row['answer'], row.get('id', f"corpus:{line_no}")))
+    return documents
+
+
+def build_index(documents, out_dir):
+    """Write the term-major TF-IDF index for documents into out_dir."""
+    vocabulary = {}
+    doc_terms = []
+    for text, _, _ in documents:
+        counts = {}
+        for term in terms(text):
+            column = vocabulary.setdefault(term, len(vocabulary))
+            counts[column] = counts.get(column, 0) + 1
+        doc_terms.append(counts)
+
+    n_docs, n_terms = len(documents), len(vocabulary)
+    df = np.zeros(n_terms)
+    for counts in doc_terms:
+        df[list(counts)] += 1
+    idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+
+    # (term, doc, weight) triples with sublinear tf and unit-length document vectors
+    term_ids, doc_ids, weights = [], [], []
+    for doc, counts in enumerate(doc_terms):
+        columns = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+        w = tf * idf[columns]
+        norm = np.linalg.norm(w)
+        term_ids.append(columns)
+        doc_ids.append(np.full(len(columns), doc, dtype=np.int32))
+        weights.append(w / norm if norm else w)
+
+    term_ids = np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int64)
+    order = np.argsort(term_ids, kind='stable')
+    postings_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=n_terms), out=postings_ptr[1:])
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, 'idf.npy'), idf)
+    np.save(os.path.join(out_dir, 'postings_ptr.npy'), postings_ptr)
+    np.save(os.path.join(out_dir, 'postings_doc.npy'), np.concatenate(doc_ids)[order])
+    np.save(os.path.join(out_dir, 'postings_weight.npy'), np.concatenate(weights)[order].astype(np.float32))
+    with open(os.path.join(out_dir, 'vocabulary.json'), 'w') as f:
+        json.dump(vocabulary, f)
+    with open(os.path.join(out_dir, 'documents.json'), 'w') as f:
+        json.dump([{'answer': answer, 'id': source_id} for _, answer, source_id in documents], f)
+    return n_docs, n_terms
+
+
+class RetrievalIndex:
+    def __init__(self, index_dir=CHAT_INDEX_DIR):
+        self.index_dir = index_dir
+        self.idf = np.load(os.path.join(index_dir, 'idf.npy'), mmap_mode='r')
+        self.postings_ptr = np.load(os.path.join(index_dir, 'postings_ptr.npy'), mmap_mode='r')
+        self.postings_doc = np.load(os.path.join(index_dir, 'postings_doc.npy'), mmap_mode='r')
+        self.postings_weight = np.load(os.path.join(index_dir, 'postings_weight.npy'), mmap_mode='r')
+        with open(os.path.join(index_dir, 'vocabulary.json'), 'r') as f:
+            self.vocabulary = json.load(f)
+        with open(os.path.join(index_dir, 'documents.json'), 'r') as f:
+            self.documents = json.load(f)
+
+    def search(self, question, k=3):
+        """Top-k [(score, document)] by cosine similarity; documents sharing an answer are merged."""
+        counts = {}
+        for term in terms(question):
+            column = self.vocabulary.get(term)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        if not counts:
+            return []
+
+        columns = list(counts)
+        query = (1 + np.log(np.array([counts[c] for c in columns], dtype=np.float64))) * self.idf[columns]
+        query /= np.linalg.norm(query)
+
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for column, weight in zip(columns, query):
+            start, end = self.postings_ptr[column], self.postings_ptr[column + 1]
+            scores[self.postings_doc[start:end]] += weight * self.postings_weight[start:end]
+
+        candidates = np.flatnonzero(scores)
+        results, seen = [], set()
+        for doc in candidates[np.argsort(-scores[candidates], kind='stable')]:
+            if len(results) == k:
+                break
+            document = self.documents[doc]
+            if document['answer'] in seen:
+                continue
+            seen.add(document['answer'])
+            results.append((float(scores[doc]), document))
+        return results
+
+    def best_answer(self, question, threshold=CHAT_RETRIEVAL_THRESHOLD):
+        """(answer, score) of the top match, or (None, score) when it falls below threshold."""
+        results = self.search(question, k=1)
+        if not results:
+            return None, 0.0
+        score, document = results[0]
+        return (document['answer'] if score >= threshold else None), score
+
+
+def source_fingerprint(kb_path=CHAT_KB_PATH, corpus_path=CHAT_CORPUS_PATH):
+    """Hash of the files an index is built from; names the index's directory."""
+    digest = hashlib.sha256()
+    for path in (kb_path, corpus_path):
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def ensure_index(kb_path=CHAT_KB_PATH, corpus_path=CHAT_CORPUS_PATH, index_root=CHAT_INDEX_DIR):
+    """Directory of the index for the current sources, building it if no worker has yet."""
+    index_dir = os.path.join(index_root, source_fingerprint(kb_path, corpus_path))
+    if os.path.exists(os.path.join(index_dir, 'postings_ptr.npy')):
+        return index_dir
+
+    # Built aside and renamed into place, so other workers never map a half-written index
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+    n_docs, n_terms = build_index(load_documents(kb_path, corpus_path), tmp_dir)
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError:
+        # Another worker got there first with the same sources
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    else:
+        print(f"Chat index built in '{index_dir}' ({n_docs} documents, {n_terms} terms)")
+    return index_dir
+
+
+def prune_indexes(index_root, keep):
+    """Remove the builds of older sources; workers still mapping them keep their pages."""
+    for name in os.listdir(index_root):
+        if _BUILD_NAME.match(name) and name != keep:
+            shutil.rmtree(os.path.join(index_root, name), ignore_errors=True)
+
+
+class ChatRetrieval:
+    """The RetrievalIndex of the current knowledge base and corpus, rebuilt when either file changes."""
+
+    def __init__(self, kb_path=CHAT_KB_PATH, corpus_path=CHAT_CORPUS_PATH, index_root=CHAT_INDEX_DIR,
+                 reload_seconds=CHAT_KB_RELOAD_SECONDS):
+        self.kb_path = kb_path
+        self.corpus_path = corpus_path
+        self.index_root = index_root
+        self.reload_seconds = reload_seconds
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._seen_mtimes = self._mtimes()
+        self.index = RetrievalIndex(ensure_index(kb_path, corpus_path, index_root))
+        prune_indexes(index_root, os.path.basename(self.index.index_dir))
+
+    def _mtimes(self):
+        return tuple(os.path.getmtime(path) if path and os.path.exists(path) else None
+                     for path in (self.kb_path, self.corpus_path))
+
+    def maybe_reload(self):
+        """Swap in the index of the changed sources; a failed build keeps the current one."""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_seconds:
+            return False
+        with self._lock:
+            if now - self._checked_at < self.reload_seconds:
+                return False
+            self._checked_at = now
+            mtimes = self._mtimes()
+            if mtimes == self._seen_mtimes:
+                return False
+            self._seen_mtimes = mtimes
+            try:
+                index_dir = ensure_index(self.kb_path, self.corpus_path, self.index_root)
+                if index_dir == self.index.index_dir:
+                    return False
+                self.index = RetrievalIndex(index_dir)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Keeping current chat retrieval index, rebuild failed: {e}")
+                return False
+            prune_indexes(self.index_root, os.path.basename(index_dir))
+            self.reloads += 1
+            print(f"Chat retrieval index rebuilt for the changed knowledge base ({index_dir})")
+            return True
+
+    def search(self, question, k=3):
+        self.maybe_reload()
+        return self.index.search(question, k)
+
+    def best_answer(self, question, threshold=CHAT_RETRIEVAL_THRESHOLD):
+        self.maybe_reload()
+        return self.index.best_answer(question, threshold)
+
+
+def load_retrieval_index(kb_path=CHAT_KB_PATH, corpus_path=CHAT_CORPUS_PATH, index_root=CHAT_INDEX_DIR):
+    """Build or reuse the index of the current sources, or return None (retrieval disabled) if that fails."""
+    try:
+        return ChatRetrieval(kb_path, corpus_path, index_root)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Chat retrieval disabled, could not build the index in '{index_root}': {e}")
+        return None
+
+
+if __name__ == '__main__':
+    kb_path = sys.argv[1] if len(sys.argv) > 1 else CHAT_KB_PATH
+    corpus_path = sys.argv[2] if len(sys.argv) > 2 else CHAT_CORPUS_PATH
+    index_root = sys.argv[3] if len(sys.argv) > 3 else CHAT_INDEX_DIR
+    print(f"Chat index ready in '{ensure_index(kb_path, corpus_path, index_root)}'")
@@ -0,0 +1,151 @@
+"""
+Chatbot knowledge base and keyword matcher.
+
+Intents (keywords -> answer) are loaded from CHAT_KB_PATH and compiled into a
+token trie, so one left-to-right pass over the question finds every
+whole-word keyword and phrase match, however many entries the file holds.
+The file is re-read when its mtime changes (checked at most every
+CHAT_KB_RELOAD_SECONDS) and swapped in atomically.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHAT_KB_PATH = os.environ.get('CHAT_KB_PATH', os.path.join(BASE_DIR, 'chat_knowledge.json'))
+CHAT_KB_RELOAD_SECONDS = float(os.environ.get('CHAT_KB_RELOAD_SECONDS', 5))
+
+DEFAULT_CONFIDENCE = 85
+DISCLAIMER = '__disclaimer__'
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_END = object()
+
+
+def _stem(token):
+    # Light plural folding so 'hurts' matches 'hurt'; applied to keywords and questions alike
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(token) for token in _TOKEN.findall(str(text).lower())]
+
+
+class KeywordMatcher:
+    """Token trie over keyword phrases; find() returns the values of every whole-word match."""
+
+    def __init__(self, phrases):
+        self._root = {}
+        for phrase, value in phrases:
+            tokens = tokenize(phrase)
+            if not tokens:
+                continue
+            node = self._root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node.setdefault(_END, []).append(value)
+
+    def find(self, text):
+        tokens = tokenize(text)
+        found = []
+        for start in range(len(tokens)):
+            node = self._root
+            for i in range(start, len(tokens)):
+                node = node.get(tokens[i])
+                if node is None:
+                    break
+                found.extend(node.get(_END, ()))
+        return found
+
+
+class ChatMatch:
+    def __init__(self, intent, intent_ids, disclaimer):
+        self.intent = intent
+        self.intent_ids = intent_ids
+        self.disclaimer = disclaimer
+
+
+class ChatKnowledgeBase:
+    """Intents from a JSON file; earlier intents win, 'fallback' intents only answer when nothing else matched."""
+
+    def __init__(self, path=CHAT_KB_PATH, reload_seconds=CHAT_KB_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self.reloads = 0
+        self._state = self._build(self._read())
+        self._seen_mtime = self._state['mtime']
+
+    def _read(self):
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, 'r') as f:
+            return json.load(f), mtime
+
+    def _build(self, loaded):
+        data, mtime = loaded
+        intents = data.get('intents', [])
+        phrases = [(keyword, i) for i, intent in enumerate(intents) for keyword in intent.get('keywords', [])]
+        phrases += [(keyword, DISCLAIMER) for keyword in data.get('disclaimer_keywords', [])]
+        return {
+            'intents': intents,
+            'matcher': KeywordMatcher(phrases),
+            'disclaimer': data.get('disclaimer', ''),
+            'mtime': mtime,
+        }
+
+    def maybe_reload(self):
+        """Swap in a fresh matcher if the file changed; a broken file keeps the current one."""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_seconds:
+            return False
+        with self._lock:
+            if now - self._checked_at < self.reload_seconds:
+                return False
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self._seen_mtime:
+                    return False
+                # Remember this version even if it fails, so a broken file is reported once
+                self._seen_mtime = mtime
+                self._state = self._build(self._read())
+            except (OSError, ValueError) as e:
+                print(f"Keeping current chat knowledge base, reload of {self.path} failed: {e}")
+                return False
+            self.reloads += 1
+            print(f"Reloaded chat knowledge base from {self.path} ({len(self._state['intents'])} intents)")
+            return True
+
+    @property
+    def disclaimer(self):
+        return self._state['disclaimer']
+
+    @property
+    def intents(self):
+        return self._state['intents']
+
+    def match(self, question):
+        self.maybe_reload()
+        state = self._state
+        hits = state['matcher'].find(question)
+        indices = sorted({hit for hit in hits if hit != DISCLAIMER})
+        intents = state['intents']
+        primary = [i for i in indices if not intents[i].get('fallback')]
+        fallback = [i for i in indices if intents[i].get('fallback')]
+        best = (primary or fallback or [None])[0]
+        return ChatMatch(
+            intent=intents[best] if best is not None else None,
+            intent_ids=[intents[i].get('id', str(i)) for i in indices],
+            disclaimer=DISCLAIMER in hits,
+        )
+
+    def stats(self):
+        return {'path': self.path, 'intents': len(self._state['intents']), 'reloads': self.reloads}
+
+
+chat_kb = ChatKnowledgeBase()
@@ -0,0 +1,182 @@
+import os
+import queue
+import threading
+import time
+
+from metrics import METRICS_ENABLED, cxr_batch_size, cxr_forward_seconds
+
+# Micro-batching settings for the chest X-ray model
+CXR_MAX_BATCH_SIZE = int(os.environ.get('CXR_MAX_BATCH_SIZE', 8))
+CXR_MAX_BATCH_DELAY_MS = float(os.environ.get('CXR_MAX_BATCH_DELAY_MS', 10))
+# Longest a request waits for its forward pass before giving up (e.g. a stalled batch thread)
+CXR_PREDICT_TIMEOUT_SECONDS = float(os.environ.get('CXR_PREDICT_TIMEOUT_SECONDS', 30))
+
+
+class InferenceTimeout(TimeoutError):
+    """The batch thread did not answer within the timeout."""
+
+
+class _PendingImage:
+    """A single preprocessed image waiting for its slot in a batch."""
+    __slots__ = ('tensor', 'trace_path', 'done', 'probs', 'error', 'abandoned')
+
+    def __init__(self, tensor, trace_path=None):
+        self.tensor = tensor
+        self.trace_path = trace_path
+        self.done = threading.Event()
+        self.probs = None
+        self.error = None
+        self.abandoned = False
+
+
+class CXRBatcher:
+    """Coalesce concurrent chest X-ray requests into one forward pass.
+
+    Request threads call predict() with a (3, H, W) tensor or array and block until
+    the worker thread has run the batch that contains it. A batch is flushed
+    when it reaches max_batch_size or when max_delay_ms has elapsed since its
+    first image arrived, whichever comes first.
+    """
+
+    def __init__(self, model, device, max_batch_size=CXR_MAX_BATCH_SIZE,
+                 max_delay_ms=CXR_MAX_BATCH_DELAY_MS):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created in the process that serves requests
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cxr-batcher', daemon=True)
+                self._thread.start()
+
+    def predict(self, img_tensor, timeout=CXR_PREDICT_TIMEOUT_SECONDS, trace_path=None):
+        """Return the sigmoid probabilities (numpy array) for one image tensor.
+
+        With trace_path, the batch is run under the torch profiler and its trace
+        written next to it (see profiling.write_torch_profile). Raises
+        InferenceTimeout when no result arrives within timeout seconds.
+        """
+        self._ensure_started()
+        item = _PendingImage(img_tensor, trace_path)
+        self._queue.put(item)
+        return self._wait(item, timeout)
+
+    def predict_many(self, img_tensors, timeout=CXR_PREDICT_TIMEOUT_SECONDS):
+        """Queue several image tensors together so they share forward passes; returns their probabilities in order."""
+        self._ensure_started()
+        items = [_PendingImage(img_tensor) for img_tensor in img_tensors]
+        for item in items:
+            self._queue.put(item)
+        try:
+            return [self._wait(item, timeout) for item in items]
+        except InferenceTimeout:
+            for item in items:
+                item.abandoned = True
+            raise
+
+    def _wait(self, item, timeout):
+        if not item.done.wait(timeout):
+            # Nobody is waiting for it any more, so the batch thread can skip it
+            item.abandoned = True
+            raise InferenceTimeout("Chest X-ray inference timed out.")
+        if item.error is not None:
+            raise item.error
+        return item.probs
+
+    def close(self):
+        """Stop the worker thread after it drains the images already queued."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back so the run loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._run_batch(self._collect_batch(first))
+
+    def _forward(self, inputs):
+        import torch
+
+        with torch.no_grad():
+            return torch.sigmoid(self.model(inputs)).cpu().numpy()
+
+    def _profiled_forward(self, inputs, trace_paths):
+        from torch.profiler import ProfilerActivity, profile
+
+        from profiling import write_torch_profile
+
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+            probs = self._forward(inputs)
+        # A failed export must not fail the requests in this batch
+        for path in trace_paths:
+            try:
+                write_torch_profile(prof, path)
+            except Exception as e:
+                print(f"Could not write torch profile {path}: {e}")
+        return probs
+
+    def _infer(self, batch):
+        # torch is imported on the batch thread, so importing this module (app.py does,
+        # for InferenceTimeout) does not load it before a model is
+        import torch
+
+        # Accepts tensors or NumPy arrays; as_tensor shares memory with the latter
+        inputs = torch.stack([torch.as_tensor(item.tensor) for item in batch]).to(self.device)
+        started = time.perf_counter()
+        trace_paths = [item.trace_path for item in batch if item.trace_path]
+        if trace_paths:
+            probs = self._profiled_forward(inputs, trace_paths)
+        else:
+            probs = self._forward(inputs)
+        if METRICS_ENABLED:
+            cxr_forward_seconds.observe(time.perf_counter() - started)
+            cxr_batch_size.observe(len(batch))
+        for item, item_probs in zip(batch, probs):
+            item.probs = item_probs
+
+    def _run_batch(self, batch):
+        batch = [item for item in batch if not item.abandoned]
+        if not batch:
+            return
+        try:
+            self._infer(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                # One malformed image must not fail the whole batch: the error goes to the image that caused it
+                for item in batch:
+                    self._run_batch([item])
+        finally:
+            for item in batch:
+                item.done.set()
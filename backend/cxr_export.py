@@ -0,0 +1,151 @@
+"""
+Export optimized CPU variants of the chest X-ray model.
+
+Variants (written next to models/cxr_model.pt as cxr_model.<mode>.pt):
+  torchscript   fp32 model traced and frozen (BatchNorm folded into convs)
+  int8-dynamic  dynamic int8 quantization of the Linear head, traced and frozen
+  int8          static post-training int8 quantization of the whole network,
+                calibrated on --calibration-dir, traced and frozen
+
+Each export also writes cxr_model.<mode>.report.json with the accuracy delta
+against the fp32 model on --eval-dir and the per-image latency of both.
+
+Usage:
+    python cxr_export.py --mode int8 --calibration-dir data/calib --eval-dir data/holdout --threads 4
+Serve a variant with CXR_SERVING_MODE=<mode>.
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from cxr_model import cxr_variant_path, configure_torch_threads, load_chest_xray_model
+from cxr_preprocess import CXR_INPUT_SIZE, load_cxr_image, preprocess_cxr
+from model_registry import CXR_MODEL_PATH
+
+CXR_NUM_CLASSES = 14
+EXPORT_MODES = ('torchscript', 'int8-dynamic', 'int8')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def list_images(directory, limit=None):
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def load_batches(paths, batch_size):
+    """Yield preprocessed (B, 3, 320, 320) tensors, using the exact (non-draft) decode path."""
+    for start in range(0, len(paths), batch_size):
+        arrays = [preprocess_cxr(load_cxr_image(p, fast=False), fast=False) for p in paths[start:start + batch_size]]
+        yield torch.from_numpy(np.stack(arrays))
+
+
+def freeze(model, example):
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model.eval(), example))
+
+
+def export_torchscript(model, example):
+    return freeze(model, example)
+
+
+def export_int8_dynamic(model, example):
+    quantized = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+    return freeze(quantized, example)
+
+
+def export_int8_static(model, example, calibration_batches):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    backend = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    torch.backends.quantized.engine = backend
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(backend), (example,))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    return freeze(convert_fx(prepared), example)
+
+
+def accuracy_report(fp32_model, variant, eval_paths, batch_size=8, threshold=0.5):
+    """Compare sigmoid outputs of a variant against fp32 on held-out images."""
+    fp32_probs, variant_probs = [], []
+    fp32_seconds = variant_seconds = 0.0
+    with torch.no_grad():
+        for batch in load_batches(eval_paths, batch_size):
+            start = time.perf_counter()
+            fp32_probs.append(torch.sigmoid(fp32_model(batch)).numpy())
+            fp32_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            variant_probs.append(torch.sigmoid(variant(batch)).numpy())
+            variant_seconds += time.perf_counter() - start
+
+    fp32_probs = np.concatenate(fp32_probs)
+    variant_probs = np.concatenate(variant_probs)
+    diff = np.abs(fp32_probs - variant_probs)
+    n_images = len(fp32_probs)
+    return {
+        'images': n_images,
+        'max_abs_prob_diff': float(diff.max()),
+        'mean_abs_prob_diff': float(diff.mean()),
+        'top1_agreement': float(np.mean(fp32_probs.argmax(axis=1) == variant_probs.argmax(axis=1))),
+        'label_agreement': float(np.mean((fp32_probs >= threshold) == (variant_probs >= threshold))),
+        'fp32_ms_per_image': round(fp32_seconds / n_images * 1000, 2),
+        'variant_ms_per_image': round(variant_seconds / n_images * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export optimized CPU variants of the chest X-ray model.")
+    parser.add_argument('--mode', choices=EXPORT_MODES, default='int8')
+    parser.add_argument('--model', default=CXR_MODEL_PATH, help="fp32 state dict to export")
+    parser.add_argument('--calibration-dir', help="images used to calibrate static int8 quantization")
+    parser.add_argument('--calibration-limit', type=int, default=200)
+    parser.add_argument('--eval-dir', help="held-out images for the accuracy-delta report")
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=0, help="intra-op threads (0 = torch default)")
+    args = parser.parse_args(argv)
+
+    configure_torch_threads(args.threads)
+    device = torch.device('cpu')
+    fp32_model = load_chest_xray_model(args.model, CXR_NUM_CLASSES, device)
+    example = torch.zeros(1, 3, CXR_INPUT_SIZE[1], CXR_INPUT_SIZE[0])
+
+    print(f"Exporting {args.mode} variant of {args.model}...")
+    if args.mode == 'torchscript':
+        variant = export_torchscript(fp32_model, example)
+    elif args.mode == 'int8-dynamic':
+        variant = export_int8_dynamic(fp32_model, example)
+    else:
+        if not args.calibration_dir:
+            parser.error("--calibration-dir is required for static int8 quantization")
+        calibration_paths = list_images(args.calibration_dir, args.calibration_limit)
+        print(f"Calibrating on {len(calibration_paths)} images...")
+        variant = export_int8_static(fp32_model, example, load_batches(calibration_paths, args.batch_size))
+
+    out_path = cxr_variant_path(args.model, args.mode)
+    torch.jit.save(variant, out_path)
+    print(f"Saved {out_path}")
+
+    if args.eval_dir:
+        eval_paths = list_images(args.eval_dir)
+        report = accuracy_report(fp32_model, variant, eval_paths, args.batch_size)
+        report.update({'mode': args.mode, 'model': os.path.basename(args.model), 'threads': torch.get_num_threads()})
+        report_path = os.path.splitext(out_path)[0] + '.report.json'
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+        print(f"Accuracy report saved as '{report_path}'")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,82 @@
+import os
+
+import torch
+import torch.nn as nn
+import torchvision.models as models
+from torchvision import transforms
+
+
+class ChestXRayModel(nn.Module):
+    def __init__(self, num_classes=14):
+        super(ChestXRayModel, self).__init__()
+        self.backbone = models.resnet50(weights=None)  # Using ResNet50 as that matches the state dict
+        in_features = self.backbone.fc.in_features
+        self.backbone.fc = nn.Linear(in_features, num_classes)
+
+    def forward(self, x):
+        return self.backbone(x)
+
+
+# Preprocessing (must match training!)
+cxr_transform = transforms.Compose([
+    transforms.Resize((320, 320)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                         std=[0.229, 0.224, 0.225]),
+])
+
+
+def get_device():
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def load_chest_xray_model(model_path, num_classes, device):
+    """Build ChestXRayModel and load the fp32 state dict from model_path."""
+    chest_xray_model = ChestXRayModel(num_classes=num_classes)
+    state_dict = torch.load(model_path, map_location=device)
+    chest_xray_model.load_state_dict(state_dict)
+    chest_xray_model.to(device)
+    chest_xray_model.eval()
+    return chest_xray_model
+
+
+def load_chest_xray_model_mmap(weights_path, num_classes):
+    """Build ChestXRayModel on CPU with its weights memory-mapped from a .safetensors file."""
+    from mmap_weights import assign_state_dict, load_safetensors_mmap
+
+    # Built on the meta device so no throwaway weights are allocated and initialised
+    with torch.device('meta'):
+        chest_xray_model = ChestXRayModel(num_classes=num_classes)
+    tensors, _ = load_safetensors_mmap(weights_path)
+    assign_state_dict(chest_xray_model, tensors)
+    chest_xray_model.eval()
+    return chest_xray_model
+
+
+# Optimized CPU variants written by cxr_export.py, selected with CXR_SERVING_MODE
+CXR_SERVING_MODES = ('fp32', 'torchscript', 'int8-dynamic', 'int8')
+
+
+def cxr_variant_path(model_path, mode):
+    """models/cxr_model.pt -> models/cxr_model.<mode>.pt"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{mode}{ext}"
+
+
+def load_cxr_variant(variant_path):
+    """Load a frozen TorchScript variant; quantized kernels only run on CPU."""
+    variant = torch.jit.load(variant_path, map_location=torch.device("cpu"))
+    variant.eval()
+    return variant
+
+
+def configure_torch_threads(intra_op_threads=0, inter_op_threads=0):
+    """Pin torch's thread pools for this worker; 0 keeps torch's default."""
+    if intra_op_threads > 0:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads > 0:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            pass
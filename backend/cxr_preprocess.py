@@ -0,0 +1,74 @@
+"""
+Fast chest X-ray preprocessing.
+
+Equivalent to cxr_model.cxr_transform (Resize(320, 320) -> ToTensor ->
+Normalize) but:
+  - JPEGs are decoded at reduced resolution with PIL's draft mode, and large
+    images are box-reduced before the bilinear resize (CXR_FAST_DECODE);
+  - grayscale scans stay single-channel until the final broadcast to 3
+    normalized channels, instead of being converted to RGB up front;
+  - the normalized array is built in NumPy and handed to torch without a copy.
+
+Run `python cxr_preprocess.py image [image ...]` to compare against cxr_transform.
+"""
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+CXR_INPUT_SIZE = (320, 320)  # (width, height)
+CXR_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+CXR_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+
+CXR_FAST_DECODE = os.environ.get('CXR_FAST_DECODE', 'true').lower() in ('1', 'true', 'yes')
+# Images are box-reduced to at most this many times the target size before resizing
+CXR_REDUCING_GAP = 3.0
+
+
+def prepare_decode(img, fast=CXR_FAST_DECODE):
+    """Ask PIL to decode a not-yet-loaded JPEG at the smallest scale still >= the model input."""
+    if fast and img.format == 'JPEG' and img.mode in ('L', 'RGB'):
+        img.draft(img.mode, CXR_INPUT_SIZE)
+    return img
+
+
+def preprocess_cxr(img, fast=CXR_FAST_DECODE):
+    """Return a normalized (3, 320, 320) float32 array for the chest X-ray model."""
+    if img.mode not in ('L', 'RGB'):
+        # Same conversion the original pipeline applied to every image
+        img = img.convert('RGB')
+
+    if img.size != CXR_INPUT_SIZE:
+        reducing_gap = CXR_REDUCING_GAP if fast else None
+        img = img.resize(CXR_INPUT_SIZE, Image.BILINEAR, reducing_gap=reducing_gap)
+
+    pixels = np.asarray(img, dtype=np.float32) / 255.0
+    if pixels.ndim == 2:
+        # Grayscale: one broadcast produces all three normalized channels
+        return (pixels[None, :, :] - CXR_MEAN) / CXR_STD
+    return (pixels.transpose(2, 0, 1) - CXR_MEAN) / CXR_STD
+
+
+def load_cxr_image(path, fast=CXR_FAST_DECODE):
+    img = prepare_decode(Image.open(path), fast)
+    img.load()
+    return img
+
+
+def compare_with_transform(path):
+    """Return (exact max, fast mean, fast max) abs differences from cxr_transform for one image."""
+    from cxr_model import cxr_transform
+
+    reference = cxr_transform(Image.open(path).convert('RGB')).numpy()
+    exact = preprocess_cxr(load_cxr_image(path, fast=False), fast=False)
+    fast = preprocess_cxr(load_cxr_image(path, fast=True), fast=True)
+    fast_diff = np.abs(fast - reference)
+    return float(np.abs(exact - reference).max()), float(fast_diff.mean()), float(fast_diff.max())
+
+
+if __name__ == '__main__':
+    for image_path in sys.argv[1:]:
+        exact_max, fast_mean, fast_max = compare_with_transform(image_path)
+        print(f"{image_path}: exact max diff {exact_max:.2e}, "
+              f"fast mean/max diff {fast_mean:.4f}/{fast_max:.3f}")
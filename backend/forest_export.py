@@ -0,0 +1,191 @@
+"""
+Flatten a trained RandomForestClassifier into contiguous NumPy arrays and
+evaluate it without sklearn.
+
+All trees are concatenated into one node table. Leaves point back to
+themselves, so every row can walk every tree in lock-step for max_depth
+steps with a handful of array gathers and no per-tree Python loop.
+
+The arrays are saved as a directory of .npy files that load memory-mapped,
+so every worker process shares one copy through the page cache. A path
+ending in .npz is written/read as a single (non-mapped) archive instead.
+
+Usage:
+    python forest_export.py [model.pkl] [label_encoder.pkl] [model_flat]
+"""
+import os
+import pickle
+import sys
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FLAT_FOREST_PATH = os.path.join(BASE_DIR, 'model_flat')
+PARITY_TOLERANCE = 1e-9
+FLAT_FOREST_ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots', 'max_depth', 'n_features', 'classes')
+
+
+def flatten_forest(forest, class_labels=None):
+    """Return a dict of flat arrays describing every tree of a fitted forest."""
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+        feature = np.where(is_leaf, 0, tree.feature)
+        # x <= +inf always holds, so a leaf keeps selecting itself
+        threshold = np.where(is_leaf, np.inf, tree.threshold)
+
+        # Same normalisation sklearn's DecisionTreeClassifier.predict_proba applies
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        value = value / normalizer
+
+        features.append(feature)
+        thresholds.append(threshold)
+        children.append(np.stack([left, right], axis=1))
+        values.append(value)
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    class_labels = np.asarray(forest.classes_ if class_labels is None else class_labels)
+    if class_labels.dtype == object:
+        # Keep the archive loadable with allow_pickle=False
+        class_labels = class_labels.astype(str)
+
+    return {
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'children': np.concatenate(children).astype(np.int32),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'max_depth': np.int32(max_depth),
+        'n_features': np.int32(forest.n_features_in_),
+        'classes': class_labels,
+    }
+
+
+class FlatForest:
+    """Array-backed random forest evaluator with a predict_proba() like sklearn's."""
+
+    def __init__(self, arrays):
+        self.feature = np.ascontiguousarray(arrays['feature'])
+        self.threshold = np.ascontiguousarray(arrays['threshold'])
+        self.children = np.ascontiguousarray(arrays['children'])
+        self.value = np.ascontiguousarray(arrays['value'])
+        self.roots = np.ascontiguousarray(arrays['roots'])
+        self.max_depth = int(arrays['max_depth'])
+        self.n_features = int(arrays['n_features'])
+        self.classes_ = np.asarray(arrays['classes'])
+        self.n_trees = len(self.roots)
+        # Interleaved [left, right] pairs so the next node is children[2 * node + go_right]
+        self._children_flat = self.children.ravel()
+
+    @classmethod
+    def load(cls, path=FLAT_FOREST_PATH):
+        if path.endswith('.npz'):
+            with np.load(path, allow_pickle=False) as data:
+                return cls({name: data[name] for name in data.files})
+        # Read-only mappings; ascontiguousarray/ravel in __init__ keep them as views
+        return cls({name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r', allow_pickle=False)
+                    for name in FLAT_FOREST_ARRAYS})
+
+    def save(self, path=FLAT_FOREST_PATH):
+        arrays = {
+            'feature': self.feature, 'threshold': self.threshold, 'children': self.children,
+            'value': self.value, 'roots': self.roots, 'max_depth': np.int32(self.max_depth),
+            'n_features': np.int32(self.n_features), 'classes': self.classes_,
+        }
+        if path.endswith('.npz'):
+            np.savez(path, **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+    def predict_proba(self, X):
+        """Return an (N, n_classes) matrix of class probabilities averaged over trees."""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[0] == 1:
+            return self._predict_row(X[0])[None, :]
+
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int64) * self.n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+        for _ in range(self.max_depth):
+            go_right = flat_X.take(self.feature.take(nodes) + row_offsets) > self.threshold.take(nodes)
+            nodes = self._children_flat.take((nodes << 1) + go_right)
+
+        return self.value.take(nodes, axis=0).mean(axis=1)
+
+    def _predict_row(self, x):
+        # Single-row fast path: one (n_trees,) node vector, no 2-D indexing
+        nodes = self.roots
+        for _ in range(self.max_depth):
+            go_right = x.take(self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self._children_flat.take((nodes << 1) + go_right)
+        return self.value.take(nodes, axis=0).sum(axis=0) / self.n_trees
+
+
+def flat_forest_files(path=FLAT_FOREST_PATH):
+    """The files making up a saved flat forest, for versioning."""
+    if path.endswith('.npz'):
+        return [path]
+    return [os.path.join(path, f"{name}.npy") for name in FLAT_FOREST_ARRAYS]
+
+
+def verify_parity(forest, flat_forest, X, tolerance=PARITY_TOLERANCE):
+    """Compare FlatForest against sklearn's predict_proba; return the max abs difference."""
+    expected = forest.predict_proba(X)
+    actual = flat_forest.predict_proba(np.asarray(X))
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > tolerance:
+        raise ValueError(f"Flat forest does not match predict_proba (max diff {max_diff:.3g}).")
+    return max_diff
+
+
+def export_forest(forest, path=FLAT_FOREST_PATH, check_X=None, class_labels=None):
+    """Flatten a forest, check it against sklearn on check_X, and save it."""
+    flat_forest = FlatForest(flatten_forest(forest, class_labels))
+    if check_X is not None:
+        max_diff = verify_parity(forest, flat_forest, check_X)
+        print(f"Flat forest parity check passed (max diff {max_diff:.3g}).")
+    flat_forest.save(path)
+    print(f"Flat forest saved as '{path}' ({flat_forest.n_trees} trees, {len(flat_forest.feature)} nodes)")
+    return flat_forest
+
+
+if __name__ == '__main__':
+    model_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BASE_DIR, 'model.pkl')
+    encoder_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(BASE_DIR, 'label_encoder.pkl')
+    out_path = sys.argv[3] if len(sys.argv) > 3 else FLAT_FOREST_PATH
+
+    with open(model_path, 'rb') as f:
+        forest = pickle.load(f)
+    with open(encoder_path, 'rb') as f:
+        label_encoder = pickle.load(f)
+
+    # Exhaustive check when the binary feature space is small, random rows otherwise
+    n_features = forest.n_features_in_
+    if n_features <= 16:
+        codes = np.arange(2 ** n_features)[:, None]
+        check_X = ((codes >> np.arange(n_features)) & 1).astype(np.float64)
+    else:
+        check_X = np.random.RandomState(0).randint(0, 2, size=(5000, n_features)).astype(np.float64)
+
+    # The forest was fit on encoded labels, so store the decoded disease names
+    class_labels = label_encoder.inverse_transform(forest.classes_.astype(int))
+    export_forest(forest, out_path, check_X=check_X, class_labels=class_labels)
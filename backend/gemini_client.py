@@ -0,0 +1,213 @@
+"""
+Gemini fallback client for /chat.
+
+All calls share one keep-alive requests.Session, so repeat questions skip the
+TCP/TLS handshake. Upstream work runs on a small bounded thread pool: a call
+that is still pending after GEMINI_HEDGE_AFTER_SECONDS gets a second (hedged)
+request and the first answer wins, with GEMINI_TIMEOUT_SECONDS as the hard
+deadline. Each request's socket timeouts are cut to what is left of that
+deadline, and losing requests that have not started are cancelled, so no
+request holds a pooled connection long after its caller has given up. Consecutive failures open a circuit breaker so /chat fails fast
+while the API is down, and answers are kept in an LRU keyed by the
+normalized question.
+
+Point GEMINI_API_URL at a local stub server to test without the real API.
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from result_cache import LRUCache
+
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+GEMINI_API_URL = os.environ.get(
+    'GEMINI_API_URL',
+    'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent',
+)
+GEMINI_TIMEOUT_SECONDS = float(os.environ.get('GEMINI_TIMEOUT_SECONDS', 10))
+GEMINI_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('GEMINI_CONNECT_TIMEOUT_SECONDS', 3))
+GEMINI_HEDGE_AFTER_SECONDS = float(os.environ.get('GEMINI_HEDGE_AFTER_SECONDS', 3))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 8))
+GEMINI_BREAKER_FAILURES = int(os.environ.get('GEMINI_BREAKER_FAILURES', 5))
+GEMINI_BREAKER_RESET_SECONDS = float(os.environ.get('GEMINI_BREAKER_RESET_SECONDS', 30))
+GEMINI_CACHE_MAX_ENTRIES = int(os.environ.get('GEMINI_CACHE_MAX_ENTRIES', 1024))
+GEMINI_CACHE_TTL_SECONDS = float(os.environ.get('GEMINI_CACHE_TTL_SECONDS', 86400))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class GeminiError(Exception):
+    """The Gemini API could not produce an answer (HTTP error, timeout or open circuit)."""
+
+
+def normalize_question(question):
+    """Cache key for a question: 'What is  Flu?? ' -> 'what is flu'."""
+    return _WHITESPACE.sub(' ', str(question).strip().lower()).rstrip('?!. ')
+
+
+def extract_answer(data):
+    """Pull the first candidate's text out of a generateContent response."""
+    return data.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures; one trial call is let through after reset_seconds."""
+
+    def __init__(self, failure_threshold=GEMINI_BREAKER_FAILURES, reset_seconds=GEMINI_BREAKER_RESET_SECONDS):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+class GeminiClient:
+    def __init__(self, api_key=GEMINI_API_KEY, url=GEMINI_API_URL, timeout=GEMINI_TIMEOUT_SECONDS,
+                 hedge_after=GEMINI_HEDGE_AFTER_SECONDS, max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 breaker=None, cache=None):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache or LRUCache(GEMINI_CACHE_MAX_ENTRIES, GEMINI_CACHE_TTL_SECONDS)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency), max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix='gemini')
+
+        self.calls = 0
+        self.hedged = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def _post(self, question, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # Queued behind other calls until the caller had already given up
+            raise GeminiError("Gemini API request expired before it was sent")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            response = self.session.post(
+                self.url,
+                params={'key': self.api_key},
+                json={'contents': [{'parts': [{'text': question}]}]},
+                timeout=(min(GEMINI_CONNECT_TIMEOUT_SECONDS, remaining), remaining),
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if response.status_code != 200:
+            raise GeminiError(f"Gemini API returned HTTP {response.status_code}")
+        return extract_answer(response.json())
+
+    def _call(self, question):
+        """Run the request, hedging once if it is slow; the first successful response wins."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        pending = {self._executor.submit(self._post, question, deadline)}
+        can_hedge = 0 < self.hedge_after < self.timeout
+        last_error = None
+
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                wait_for = deadline - now
+                if can_hedge:
+                    wait_for = min(wait_for, max(0.0, started + self.hedge_after - now))
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    last_error = future.exception()
+                if can_hedge and pending and time.monotonic() >= started + self.hedge_after:
+                    can_hedge = False
+                    self.hedged += 1
+                    pending.add(self._executor.submit(self._post, question, deadline))
+        finally:
+            # Requests already sent end by the deadline through their own timeouts
+            for future in pending:
+                future.cancel()
+
+        if last_error is not None and not pending:
+            raise last_error
+        raise GeminiError(f"Gemini API did not answer within {self.timeout:g}s")
+
+    def ask(self, question):
+        """Answer text for a question ('' if Gemini had none); raises GeminiError on failure."""
+        key = normalize_question(question)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if not self.breaker.allow():
+            raise GeminiError("Gemini API is temporarily unavailable")
+
+        self.calls += 1
+        try:
+            answer = self._call(question)
+        except Exception:
+            self.errors += 1
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        if answer:
+            self.cache.set(key, answer)
+        return answer
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'calls': self.calls,
+            'hedged': self.hedged,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'breaker': self.breaker.stats(),
+            'cache': self.cache.stats(),
+        }
+
+
+gemini_client = GeminiClient()
@@ -0,0 +1,56 @@
+"""
+gunicorn settings for the backend (loaded automatically from this directory).
+
+The app and its models are preloaded in the master and workers are forked
+from it. `kill -HUP <master pid>` reloads the model files in the master and
+then gracefully replaces the workers, so new model files go live without
+dropping in-flight requests.
+"""
+import multiprocessing
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count() // 2)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+preload_app = os.environ.get('GUNICORN_PRELOAD_APP', 'true').lower() in ('1', 'true', 'yes')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def on_reload(server):
+    # Runs in the master on HUP, before the replacement workers are forked
+    if preload_app:
+        from wsgi import model_registry
+        # No warm-up forward pass here: torch's thread pools must not be started before forking
+        try:
+            version = model_registry.reload(warm=False)
+            server.log.info("Reloaded models, serving version %s", version)
+        except Exception as e:
+            server.log.error("Model reload failed, workers keep the current version: %s", e)
+
+
+def post_fork(server, worker):
+    from auth_simple import dispose_pool_after_fork
+    from model_registry import CXR_INTRA_OP_THREADS
+
+    # Database connections opened by the master must not be shared with workers.
+    # (The bcrypt pool, which the master uses to create the default admin,
+    # replaces its threads by itself through os.register_at_fork.)
+    dispose_pool_after_fork()
+
+    # Split the cores between workers unless torch threads were pinned explicitly
+    if CXR_INTRA_OP_THREADS == 0 and 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(max(1, multiprocessing.cpu_count() // workers))
+
+
+def post_worker_init(worker):
+    # Runs in each worker once it has the app (preloaded or not), so queued jobs
+    # are picked up after a restart without waiting for a first request
+    from wsgi import job_queue
+    job_queue.ensure_started()
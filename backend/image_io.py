@@ -0,0 +1,91 @@
+import io
+import os
+
+from flask import Request
+from PIL import Image, UnidentifiedImageError
+
+# Upload limits for /analyze-image
+MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', 20))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Room for the multipart framing and any other form fields around the image
+MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 64 * 1024
+
+_READ_CHUNK_BYTES = 64 * 1024
+
+# Leading bytes of the formats PIL can decode for us
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+)
+
+
+class UploadError(ValueError):
+    """An upload rejected before decoding; carries the HTTP status to return."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class InMemoryUploadRequest(Request):
+    """Request whose multipart file parts are buffered in memory, never spooled to disk.
+
+    Memory per request is bounded by the app's MAX_CONTENT_LENGTH.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
+def sniff_image_format(header):
+    """Return the image format named by the leading bytes, or None if it is not a known image."""
+    for signature, image_format in _IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def read_upload_bytes(file_storage, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an uploaded file into memory, rejecting non-images and oversized files early."""
+    stream = file_storage.stream
+    header = stream.read(16)
+    if sniff_image_format(header) is None:
+        raise UploadError("Uploaded file is not a supported image.", 415)
+
+    buffer = bytearray(header)
+    while True:
+        chunk = stream.read(_READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadError(f"Image exceeds the {MAX_UPLOAD_MB:g} MB upload limit.", 413)
+    return bytes(buffer)
+
+
+def open_image_bytes(data, prepare=None):
+    """Open image bytes with PIL without touching the filesystem.
+
+    `prepare` is called on the opened image before pixel data is decoded,
+    e.g. to request a reduced-resolution JPEG decode.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        if prepare is not None:
+            img = prepare(img)
+        img.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise UploadError(f"Could not decode image: {e}", 415)
+    return img
+
+
+def read_image_upload(file_storage, max_bytes=MAX_UPLOAD_BYTES, prepare=None):
+    """Decode an uploaded image straight from the request stream (no temp files)."""
+    return open_image_bytes(read_upload_bytes(file_storage, max_bytes), prepare)
@@ -0,0 +1,396 @@
+"""
+Persistent job queue for slow chest X-ray analyses.
+
+Jobs are rows in a local SQLite database (JOB_QUEUE_DB), so every worker
+process on the host shares one queue and queued jobs survive a restart;
+their images are kept as files under JOB_DATA_DIR. Each process runs
+JOB_WORKERS threads that claim jobs highest priority lane first, oldest
+first within a lane, skipping users who already have
+JOB_MAX_RUNNING_PER_USER jobs running. Claims use an immediate
+transaction, so two processes can never claim the same job, and each claim
+gets its own token: only the holder of the current token can finish a job.
+
+While a job runs, its process refreshes the job's heartbeat every
+JOB_HEARTBEAT_SECONDS. A running job whose heartbeat is older than
+JOB_STALE_SECONDS (its process died) is queued again, however long a live
+job takes. Finished jobs and their files are deleted after
+JOB_RETENTION_SECONDS.
+"""
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_QUEUE_DB = os.environ.get('JOB_QUEUE_DB', os.path.join(BASE_DIR, 'jobs', 'jobs.sqlite3'))
+JOB_DATA_DIR = os.environ.get('JOB_DATA_DIR', os.path.join(BASE_DIR, 'jobs', 'data'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+JOB_MAX_RUNNING_PER_USER = int(os.environ.get('JOB_MAX_RUNNING_PER_USER', 1))
+JOB_MAX_QUEUED_PER_USER = int(os.environ.get('JOB_MAX_QUEUED_PER_USER', 20))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', 10))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 60))
+JOB_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 86400))
+
+# Lanes, highest first
+PRIORITIES = {'high': 2, 'normal': 1, 'low': 0}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claim_token TEXT,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_claim ON jobs (status, priority, created_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_user ON jobs (user_id, status);
+"""
+
+_CLAIM_SQL = """
+SELECT * FROM jobs
+WHERE status = 'queued'
+  AND user_id NOT IN (
+      SELECT user_id FROM jobs WHERE status = 'running'
+      GROUP BY user_id HAVING COUNT(*) >= ?)
+ORDER BY priority DESC, created_at
+LIMIT 1
+"""
+
+# Columns added after the first release, for databases created before them
+_MIGRATIONS = (
+    ('claim_token', 'ALTER TABLE jobs ADD COLUMN claim_token TEXT'),
+    ('heartbeat_at', 'ALTER TABLE jobs ADD COLUMN heartbeat_at REAL'),
+)
+
+
+class JobLimitExceeded(Exception):
+    """The user already has JOB_MAX_QUEUED_PER_USER jobs waiting."""
+
+
+class Job:
+    """One row of the queue, with its payload and result decoded."""
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.user_id = row['user_id']
+        self.priority = row['priority']
+        self.status = row['status']
+        self.payload = json.loads(row['payload'])
+        self.result = json.loads(row['result']) if row['result'] else None
+        self.error = row['error']
+        self.attempts = row['attempts']
+        self.claim_token = row['claim_token']
+        self.created_at = row['created_at']
+        self.started_at = row['started_at']
+        self.finished_at = row['finished_at']
+
+    def to_dict(self):
+        def iso(timestamp):
+            return None if timestamp is None else time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+        data = {
+            'jobId': self.id,
+            'status': self.status,
+            'priority': PRIORITY_NAMES.get(self.priority, self.priority),
+            'images': len(self.payload.get('images', [])),
+            'createdAt': iso(self.created_at),
+            'startedAt': iso(self.started_at),
+            'finishedAt': iso(self.finished_at),
+        }
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """SQLite-backed queue plus the worker threads of this process.
+
+    handler(job) runs a claimed job and returns its JSON-serializable result;
+    an exception marks the job failed with its message.
+    """
+
+    def __init__(self, handler, db_path=JOB_QUEUE_DB, data_dir=JOB_DATA_DIR, workers=JOB_WORKERS):
+        self.handler = handler
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.workers = max(0, workers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._heartbeat_thread = None
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._cleaned_at = 0.0
+        # job id -> claim token of the jobs this process is running, for the heartbeat
+        self._claims = {}
+        self._claims_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(data_dir, exist_ok=True)
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(_SCHEMA)
+        columns = {row['name'] for row in connection.execute('PRAGMA table_info(jobs)')}
+        for column, sql in _MIGRATIONS:
+            if column not in columns:
+                connection.execute(sql)
+
+    def _connection(self):
+        # sqlite3 connections must stay in the thread (and process) that opened them
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def ensure_started(self):
+        """Start this process's worker threads (after a fork they must be started again)."""
+        if self._started_pid == os.getpid() or not self.workers:
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{n}", daemon=True)
+                for n in range(self.workers)
+            ]
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+            self._heartbeat_thread.start()
+            for thread in self._threads:
+                thread.start()
+            self._started_pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+        self._threads = []
+        self._heartbeat_thread = None
+        self._started_pid = None
+
+    def submit(self, user_id, images, priority='normal', metadata=None):
+        """Store images [(filename, bytes)] and queue a job for them; returns the Job."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        connection = self._connection()
+        queued = connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status = 'queued'", (user_id,)).fetchone()[0]
+        if queued >= JOB_MAX_QUEUED_PER_USER:
+            raise JobLimitExceeded(f"At most {JOB_MAX_QUEUED_PER_USER} queued jobs per user")
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.data_dir, job_id)
+        os.makedirs(job_dir)
+        stored = []
+        for index, (filename, data) in enumerate(images):
+            path = os.path.join(job_dir, f"{index}.img")
+            with open(path, 'wb') as f:
+                f.write(data)
+            stored.append({'filename': filename, 'path': os.path.relpath(path, self.data_dir)})
+        payload = {'images': stored}
+        if metadata:
+            payload['metadata'] = metadata
+
+        connection.execute(
+            "INSERT INTO jobs (id, user_id, priority, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, PRIORITIES[priority], QUEUED, json.dumps(payload), time.time()))
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def image_path(self, image):
+        return os.path.join(self.data_dir, image['path'])
+
+    def get(self, job_id, user_id=None):
+        sql, params = "SELECT * FROM jobs WHERE id = ?", [job_id]
+        if user_id is not None:
+            sql, params = sql + " AND user_id = ?", params + [user_id]
+        row = self._connection().execute(sql, params).fetchone()
+        return Job(row) if row else None
+
+    def list(self, user_id, limit=50):
+        rows = self._connection().execute(
+            "SELECT * FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (user_id, limit)).fetchall()
+        return [Job(row) for row in rows]
+
+    def position(self, job):
+        """Jobs that will be claimed before this queued one."""
+        if job.status != QUEUED:
+            return None
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "(priority > ? OR (priority = ? AND created_at < ?))",
+            (job.priority, job.priority, job.created_at)).fetchone()[0]
+
+    def cancel(self, job_id, user_id):
+        """Cancel a job that has not started; returns True if it was cancelled."""
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND user_id = ? AND status = 'queued'",
+            (CANCELLED, time.time(), job_id, user_id))
+        if cursor.rowcount:
+            shutil.rmtree(os.path.join(self.data_dir, job_id), ignore_errors=True)
+        return cursor.rowcount > 0
+
+    def claim(self):
+        """Atomically take the next runnable job, or return None.
+
+        The returned job carries a fresh claim_token; its heartbeat is kept
+        up by this process until finish() is called with it.
+        """
+        connection = self._connection()
+        token = uuid.uuid4().hex
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._requeue_stale(connection)
+            row = connection.execute(_CLAIM_SQL, (max(1, JOB_MAX_RUNNING_PER_USER),)).fetchone()
+            if row is None:
+                connection.execute('COMMIT')
+                return None
+            now = time.time()
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, claim_token = ?, started_at = ?, heartbeat_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, self.worker_id, token, now, now, row['id']))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        with self._claims_lock:
+            self._claims[row['id']] = token
+        return self.get(row['id'])
+
+    def _requeue_stale(self, connection):
+        # A job whose heartbeat stopped was left by a dead process; retry it, up to JOB_MAX_ATTEMPTS
+        cutoff = time.time() - JOB_STALE_SECONDS
+        stale = "status = 'running' AND COALESCE(heartbeat_at, started_at) < ?"
+        connection.execute(
+            f"UPDATE jobs SET status = ?, error = 'Worker stopped while running the job', finished_at = ?, "
+            f"claim_token = NULL WHERE {stale} AND attempts >= ?",
+            (FAILED, time.time(), cutoff, JOB_MAX_ATTEMPTS))
+        connection.execute(
+            f"UPDATE jobs SET status = 'queued', worker = NULL, claim_token = NULL WHERE {stale}",
+            (cutoff,))
+
+    def beat(self):
+        """Refresh the heartbeat of every job this process is running."""
+        with self._claims_lock:
+            claims = list(self._claims.items())
+        if not claims:
+            return
+        now = time.time()
+        self._connection().executemany(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND claim_token = ?",
+            [(now, job_id, token) for job_id, token in claims])
+
+    def _heartbeat(self):
+        while not self._stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                self.beat()
+            except sqlite3.Error as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def finish(self, job, status, result=None, error=None):
+        """Record the outcome of a claimed job; returns False if the claim was lost (the job was requeued)."""
+        with self._claims_lock:
+            self._claims.pop(job.id, None)
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, claim_token = NULL "
+            "WHERE id = ? AND status = 'running' AND claim_token = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(),
+             job.id, job.claim_token))
+        if cursor.rowcount:
+            shutil.rmtree(os.path.join(self.data_dir, job.id), ignore_errors=True)
+        return cursor.rowcount > 0
+
+    def cleanup(self, now=None):
+        """Delete finished jobs older than JOB_RETENTION_SECONDS."""
+        now = time.time() if now is None else now
+        connection = self._connection()
+        rows = connection.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+            FINISHED_STATUSES + (now - JOB_RETENTION_SECONDS,)).fetchall()
+        for row in rows:
+            shutil.rmtree(os.path.join(self.data_dir, row['id']), ignore_errors=True)
+        connection.executemany("DELETE FROM jobs WHERE id = ?", [(row['id'],) for row in rows])
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.claim()
+            except sqlite3.Error as e:
+                print(f"Job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._maybe_cleanup()
+                self._wakeup.wait(JOB_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                self.failed += 1
+                print(f"Job {job.id} failed: {e}")
+                finished = self.finish(job, FAILED, error=str(e))
+            else:
+                self.completed += 1
+                finished = self.finish(job, DONE, result=result)
+            if not finished:
+                print(f"Job {job.id} was requeued while it ran; its outcome here was discarded")
+            # More work may be waiting, e.g. for a user who was at their limit
+            self._wakeup.set()
+
+    def _maybe_cleanup(self):
+        now = time.time()
+        if now - self._cleaned_at < 60:
+            return
+        self._cleaned_at = now
+        try:
+            self.cleanup(now)
+        except sqlite3.Error as e:
+            print(f"Job cleanup failed: {e}")
+
+    def stats(self):
+        counts = dict(self._connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            'workers': len(self._threads),
+            'queued': counts.get(QUEUED, 0),
+            'running': counts.get(RUNNING, 0),
+            'done': counts.get(DONE, 0),
+            'failed': counts.get(FAILED, 0),
+            'completed_here': self.completed,
+            'failed_here': self.failed,
+        }
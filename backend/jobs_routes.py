@@ -0,0 +1,82 @@
+import os
+
+from flask import request, jsonify, g
+
+from auth_simple import require_auth
+from image_io import UploadError, read_upload_bytes
+from job_queue import PRIORITIES, JobLimitExceeded
+from metrics import flatten_stats, registry
+
+# Most images accepted in one study; they share the request's MAX_UPLOAD_MB body limit
+JOB_MAX_IMAGES = int(os.environ.get('JOB_MAX_IMAGES', 16))
+
+
+def init_jobs_routes(app, job_queue):
+    @app.before_request
+    def start_job_workers():
+        # wsgi.py and gunicorn start them at startup; this covers `python app.py` and other entry points
+        job_queue.ensure_started()
+
+    registry.collector(lambda: flatten_stats('jobs', job_queue.stats(), 'Analysis job queue gauges.'))
+
+    @app.route('/analyze-image/jobs', methods=['POST'])
+    @require_auth
+    def create_analysis_job():
+        """Queue one or more images (a multi-view study) for analysis; poll the returned job for the result."""
+        files = request.files.getlist('image') + request.files.getlist('images')
+        files = [f for f in files if f.filename]
+        if not files:
+            return jsonify({"error": "No image file provided."}), 400
+        if len(files) > JOB_MAX_IMAGES:
+            return jsonify({"error": f"At most {JOB_MAX_IMAGES} images per job."}), 400
+
+        priority = request.form.get('priority', 'normal')
+        if priority not in PRIORITIES:
+            return jsonify({"error": f"priority must be one of: {', '.join(PRIORITIES)}"}), 400
+
+        try:
+            images = [(f.filename, read_upload_bytes(f)) for f in files]
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status_code
+
+        try:
+            job = job_queue.submit(g.user_id, images, priority)
+        except JobLimitExceeded as e:
+            response = jsonify({"error": str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 429
+
+        data = job.to_dict()
+        data['position'] = job_queue.position(job)
+        response = jsonify(data)
+        response.headers['Location'] = f"/analyze-image/jobs/{job.id}"
+        return response, 202
+
+    @app.route('/analyze-image/jobs', methods=['GET'])
+    @require_auth
+    def list_analysis_jobs():
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        return jsonify({'jobs': [job.to_dict() for job in job_queue.list(g.user_id, limit)]})
+
+    @app.route('/analyze-image/jobs/<job_id>', methods=['GET'])
+    @require_auth
+    def get_analysis_job(job_id):
+        job = job_queue.get(job_id, user_id=g.user_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        data = job.to_dict()
+        if job.status == 'queued':
+            data['position'] = job_queue.position(job)
+        return jsonify(data)
+
+    @app.route('/analyze-image/jobs/<job_id>', methods=['DELETE'])
+    @require_auth
+    def cancel_analysis_job(job_id):
+        if job_queue.cancel(job_id, g.user_id):
+            return jsonify({'jobId': job_id, 'status': 'cancelled'})
+        job = job_queue.get(job_id, user_id=g.user_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"error": f"Job is {job.status} and can no longer be cancelled"}), 409
+
+    return app
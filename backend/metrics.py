@@ -0,0 +1,237 @@
+"""
+Request and per-stage latency metrics, exposed at /metrics in the Prometheus
+text format.
+
+Handlers time their stages with a StageTimer; every request is counted by
+endpoint, method and status and its duration recorded in a histogram.
+Cache, connection pool and model gauges are read from the components'
+stats() when /metrics is scraped, so they cost nothing between scrapes.
+
+Values are kept per process: under gunicorn each worker reports its own,
+so scrape the workers individually or sum in the query.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Seconds; covers a cached /predict (sub-millisecond) up to a slow CPU forward pass
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, as Prometheus expects it."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + (('le', _format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", labels, round(total, 6)
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    """Metrics recorded as they happen, plus collectors that produce gauges at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """fn() yields (name, documentation, [(labels, value), ...]) gauges; usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collect in self._collectors:
+            try:
+                gauges = list(collect())
+            except Exception as e:
+                print(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, documentation, samples in gauges:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status.', ('endpoint', 'method', 'status'))
+http_request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by endpoint.', ('endpoint',))
+stage_seconds = registry.histogram(
+    'request_stage_duration_seconds', 'Time spent in each stage of a request handler.', ('endpoint', 'stage'))
+cxr_forward_seconds = registry.histogram(
+    'cxr_forward_duration_seconds', 'Chest X-ray forward pass time per batch.')
+cxr_batch_size = registry.histogram(
+    'cxr_batch_size', 'Images per chest X-ray forward pass.', buckets=BATCH_SIZE_BUCKETS)
+
+
+class StageTimer:
+    """Times the consecutive stages of one request handler.
+
+    mark('decode') records the time since the previous mark (or since the
+    timer was created) as the 'decode' stage of this endpoint.
+    """
+
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint or (request.endpoint if has_request_context() else None) or 'unknown'
+        self.started = self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        if METRICS_ENABLED:
+            stage_seconds.observe(now - self._last, endpoint=self.endpoint, stage=stage)
+        self._last = now
+
+    def elapsed_ms(self):
+        return int(round((time.perf_counter() - self.started) * 1000))
+
+
+def flatten_stats(prefix, stats, documentation):
+    """Numeric leaves of a nested stats() dict as gauges named prefix_key_subkey."""
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from flatten_stats(name, value, documentation)
+        elif isinstance(value, (bool, int, float)):
+            yield name, documentation, [((), int(value) if isinstance(value, bool) else value)]
+
+
+def init_metrics(app, model_registry, result_cache):
+    """Count and time every request, and serve /metrics."""
+    if not METRICS_ENABLED:
+        return app
+
+    from auth_simple import pool_stats
+    from chat_kb import chat_kb
+    from gemini_client import gemini_client
+    from password_pool import password_pool
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        endpoint = request.endpoint or 'unmatched'
+        http_requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if started is not None:
+            http_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+    @registry.collector
+    def model_gauges():
+        report = model_registry.report()
+        models = report['models'].items()
+        yield 'model_loaded', 'Whether each model is loaded (1) or not (0).', [
+            ((('model', name),), int(state['loaded'])) for name, state in models]
+        yield 'model_load_seconds', 'Time the last load of each model took.', [
+            ((('model', name),), state['load_seconds']) for name, state in models if state['load_seconds'] is not None]
+        yield 'model_reloads', 'Model versions swapped in since startup.', [((), report['reloads'])]
+
+    @registry.collector
+    def component_gauges():
+        yield from flatten_stats('result_cache', result_cache.stats(), 'Result cache counters and size.')
+        yield from flatten_stats('db_pool', pool_stats(), 'Database connection pool gauges.')
+        yield from flatten_stats('password_pool', password_pool.stats(), 'bcrypt worker pool gauges.')
+        yield from flatten_stats('gemini', gemini_client.stats(), 'Gemini client counters.')
+        yield from flatten_stats('chat_kb', chat_kb.stats(), 'Chat knowledge base size and reloads.')
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
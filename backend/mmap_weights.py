@@ -0,0 +1,154 @@
+"""
+Memory-mapped model weights shared by every worker process.
+
+Tensors are stored in the safetensors layout (8-byte header length, JSON
+header, one contiguous data buffer), written and read with NumPy so the
+safetensors package is not needed; the files still open with it. Loading
+maps the file copy-on-write and points the model's parameters straight at
+the mapped pages, so all workers on a host share one copy through the page
+cache instead of each holding its own.
+
+The export records the sha256, size and mtime of the source .pt in the
+file's metadata. If the .pt is later replaced (retrained or published), the
+mapped copy is stale: source_is_current() detects that, and the loader then
+serves the .pt instead.
+
+Convert a state dict with:
+    python mmap_weights.py models/cxr_model.pt [models/cxr_model.safetensors]
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import torch
+
+from model_store import sha256_file
+
+# safetensors dtype codes
+DTYPES = {
+    'F64': np.float64, 'F32': np.float32, 'F16': np.float16,
+    'I64': np.int64, 'I32': np.int32, 'I16': np.int16, 'I8': np.int8,
+    'U8': np.uint8, 'BOOL': np.bool_,
+}
+DTYPE_CODES = {np.dtype(dtype): code for code, dtype in DTYPES.items()}
+
+
+def safetensors_path(model_path):
+    """models/cxr_model.pt -> models/cxr_model.safetensors"""
+    return os.path.splitext(model_path)[0] + '.safetensors'
+
+
+def save_safetensors(tensors, path, metadata=None):
+    """Write a dict of tensors in the safetensors layout, atomically."""
+    arrays = {name: tensor.detach().cpu().contiguous().numpy() for name, tensor in tensors.items()}
+    # Widest dtypes first keeps every tensor naturally aligned without gaps in the buffer
+    names = sorted(arrays, key=lambda name: (-arrays[name].dtype.itemsize, name))
+
+    header, offset = {}, 0
+    for name in names:
+        array = arrays[name]
+        header[name] = {
+            'dtype': DTYPE_CODES[array.dtype],
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + array.nbytes],
+        }
+        offset += array.nbytes
+    if metadata:
+        header['__metadata__'] = {key: str(value) for key, value in metadata.items()}
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # Pad with spaces so the data buffer starts 8-byte aligned
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            f.write(arrays[name].tobytes())
+    os.replace(tmp_path, path)
+
+
+def source_metadata(source_path):
+    """Identity of the .pt a safetensors file is exported from, stored in its metadata."""
+    stat = os.stat(source_path)
+    return {
+        'source': os.path.basename(source_path),
+        'source_sha256': sha256_file(source_path),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def read_metadata(path):
+    """The __metadata__ of a safetensors file, read from its header only."""
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        return json.loads(f.read(header_size)).get('__metadata__', {})
+
+
+def source_is_current(weights_path, source_path):
+    """Whether weights_path was exported from source_path as it is now.
+
+    Size and mtime unchanged means unchanged; otherwise (e.g. after a copy)
+    the sha256 decides. Files exported without a source hash count as stale.
+    """
+    metadata = read_metadata(weights_path)
+    if 'source_sha256' not in metadata:
+        return False
+    stat = os.stat(source_path)
+    if (metadata.get('source_size') == str(stat.st_size)
+            and metadata.get('source_mtime_ns') == str(stat.st_mtime_ns)):
+        return True
+    return metadata['source_sha256'] == sha256_file(source_path)
+
+
+def load_safetensors_mmap(path):
+    """Return ({name: tensor}, metadata) with every tensor backed by a shared mapping of path."""
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    metadata = header.pop('__metadata__', {})
+
+    # mode='c' maps MAP_PRIVATE: pages come from the shared page cache and are only
+    # copied for a process that writes to them, which inference never does
+    buffer = np.memmap(path, dtype=np.uint8, mode='c', offset=8 + header_size)
+    tensors = {}
+    for name, info in header.items():
+        start, end = info['data_offsets']
+        array = buffer[start:end].view(DTYPES[info['dtype']]).reshape(info['shape'])
+        tensors[name] = torch.from_numpy(array)
+    return tensors, metadata
+
+
+def assign_state_dict(module, tensors):
+    """Point module parameters and buffers at tensors instead of copying into them."""
+    expected = module.state_dict()
+    missing = sorted(set(expected) - set(tensors))
+    unexpected = sorted(set(tensors) - set(expected))
+    if missing or unexpected:
+        raise RuntimeError(f"State dict mismatch: missing {missing[:5]}, unexpected {unexpected[:5]}")
+
+    for name, tensor in tensors.items():
+        if tuple(expected[name].shape) != tuple(tensor.shape):
+            raise RuntimeError(f"Shape mismatch for {name}: {tuple(tensor.shape)} vs {tuple(expected[name].shape)}")
+        owner_name, _, attr = name.rpartition('.')
+        owner = module.get_submodule(owner_name) if owner_name else module
+        if attr in owner._parameters:
+            owner._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            owner._buffers[attr] = tensor
+    return module
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python mmap_weights.py <state_dict.pt> [out.safetensors]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else safetensors_path(source)
+    state_dict = torch.load(source, map_location='cpu')
+    save_safetensors(state_dict, target, metadata=source_metadata(source))
+    print(f"Saved {len(state_dict)} tensors to '{target}'")
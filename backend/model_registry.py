@@ -0,0 +1,334 @@
+"""
+Lazy model loading for the Flask app.
+
+Nothing heavy (torch, torchvision, sklearn pickles, the ResNet50 weights)
+is imported or read until the first request that needs it, so endpoints
+like /auth/* and /chat start instantly. Set MODEL_EAGER_WARMUP=1 to load
+everything at startup instead.
+
+Models come from the live version of the model store (model_store.py), or
+from the backend directory when no version is active. A new version is
+loaded and warmed up next to the current one and then swapped in at once.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from model_store import MODEL_STORE_POLL_SECONDS, ModelStoreError, current_bundle, current_version, local_bundle
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CXR_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'cxr_model.pt')
+
+MODEL_EAGER_WARMUP = os.environ.get('MODEL_EAGER_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+
+# Which chest X-ray variant to serve (see cxr_export.py) and how many torch threads per worker
+CXR_SERVING_MODE = os.environ.get('CXR_SERVING_MODE', 'fp32')
+CXR_INTRA_OP_THREADS = int(os.environ.get('CXR_INTRA_OP_THREADS', 0))
+CXR_INTER_OP_THREADS = int(os.environ.get('CXR_INTER_OP_THREADS', 0))
+
+# Serve fp32 CPU weights from models/cxr_model.safetensors (mmap, shared by all workers) when present
+CXR_MMAP_WEIGHTS = os.environ.get('CXR_MMAP_WEIGHTS', 'true').lower() in ('1', 'true', 'yes')
+
+# How long replaced models stay open for requests that started before a version swap
+MODEL_RETIRE_SECONDS = float(os.environ.get('MODEL_RETIRE_SECONDS', 60))
+# After a model fails to load (I/O error, out of memory), requests get no model for this long, then it is retried
+MODEL_LOAD_RETRY_SECONDS = float(os.environ.get('MODEL_LOAD_RETRY_SECONDS', 30))
+
+
+def file_version(*paths, extra=''):
+    """Short fingerprint of model files (name, size, mtime), used to key cached results."""
+    digest = hashlib.sha1(extra.encode('utf-8'))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class SymptomModel:
+    """Everything /predict needs: a scorer with predict_proba, labels and the symptom index."""
+
+    def __init__(self, scorer, disease_labels, symptom_columns, symptom_index, version=None):
+        self.scorer = scorer
+        self.disease_labels = disease_labels
+        self.symptom_columns = symptom_columns
+        self.symptom_index = symptom_index
+        self.version = version
+
+    def predict_proba(self, X):
+        return self.scorer.predict_proba(X)
+
+    def warm(self):
+        import numpy as np
+        self.predict_proba(np.zeros((1, len(self.symptom_columns))))
+
+
+class CXRModel:
+    """The chest X-ray network together with its device, preprocessing and batcher."""
+
+    def __init__(self, model, device, transform, batcher, version=None):
+        self.model = model
+        self.device = device
+        self.transform = transform
+        self.batcher = batcher
+        self.version = version
+
+    def warm(self):
+        import torch
+        from cxr_preprocess import CXR_INPUT_SIZE
+        with torch.no_grad():
+            self.model(torch.zeros(1, 3, CXR_INPUT_SIZE[1], CXR_INPUT_SIZE[0], device=self.device))
+
+    def close(self):
+        self.batcher.close()
+
+
+def load_symptom_model(bundle=None):
+    """Load the symptom model, preferring the flat forest so sklearn is never imported."""
+    from forest_export import FlatForest, flat_forest_files
+    from symptom_index import SymptomIndex
+
+    bundle = bundle or local_bundle()
+    if not os.path.exists(bundle.symptom_columns_path):
+        print("Model files not found. Please run train_model.py first.")
+        return None
+    with open(bundle.symptom_columns_path, 'rb') as f:
+        symptom_columns = pickle.load(f)
+
+    if os.path.exists(bundle.flat_forest_path):
+        scorer = FlatForest.load(bundle.flat_forest_path)
+        disease_labels = scorer.classes_
+        files = flat_forest_files(bundle.flat_forest_path)
+    elif os.path.exists(bundle.symptom_model_path) and os.path.exists(bundle.label_encoder_path):
+        # Array-backed forest not exported yet: fall back to sklearn
+        with open(bundle.symptom_model_path, 'rb') as f:
+            scorer = pickle.load(f)
+        with open(bundle.label_encoder_path, 'rb') as f:
+            label_encoder = pickle.load(f)
+        disease_labels = label_encoder.inverse_transform(scorer.classes_.astype(int))
+        files = [bundle.symptom_model_path, bundle.label_encoder_path]
+    else:
+        print("Model files not found. Please run train_model.py first.")
+        return None
+
+    print(f"Model and related files loaded successfully! (version {bundle.version})")
+    version = f"{bundle.version}:{file_version(*files, bundle.symptom_columns_path)}"
+    return SymptomModel(scorer, disease_labels, symptom_columns, SymptomIndex(symptom_columns), version)
+
+
+def load_cxr_model(num_classes, mode=CXR_SERVING_MODE, bundle=None):
+    """Import torch and load the chest X-ray model, or return None if the weights are missing."""
+    from cxr_model import CXR_SERVING_MODES, cxr_variant_path
+    from mmap_weights import safetensors_path, source_is_current
+
+    if mode not in CXR_SERVING_MODES:
+        raise ValueError(f"Unknown CXR_SERVING_MODE '{mode}', expected one of {CXR_SERVING_MODES}")
+    bundle = bundle or local_bundle()
+    base_path = bundle.cxr_model_path
+    model_path = base_path if mode == 'fp32' else cxr_variant_path(base_path, mode)
+    weights_path = safetensors_path(base_path)
+    use_mmap = mode == 'fp32' and CXR_MMAP_WEIGHTS and os.path.exists(weights_path)
+    if use_mmap and os.path.exists(base_path) and not source_is_current(weights_path, base_path):
+        # The .pt was replaced after the export; serving the old mapped weights would be wrong
+        print(f"Ignoring {weights_path}: it was not exported from the current {os.path.basename(base_path)}. "
+              f"Run 'python mmap_weights.py {base_path}' to re-export it.")
+        use_mmap = False
+    if not use_mmap and not os.path.exists(model_path):
+        print(f"Chest X-Ray model not found ({mode}).")
+        return None
+
+    import torch
+    from cxr_batcher import CXRBatcher
+    from cxr_model import (configure_torch_threads, get_device, load_chest_xray_model,
+                           load_chest_xray_model_mmap, load_cxr_variant)
+    from cxr_preprocess import CXR_FAST_DECODE, preprocess_cxr
+
+    configure_torch_threads(CXR_INTRA_OP_THREADS, CXR_INTER_OP_THREADS)
+    if mode == 'fp32':
+        device = get_device()
+        if use_mmap and device.type == 'cpu':
+            model_path = weights_path
+            chest_xray_model = load_chest_xray_model_mmap(model_path, num_classes)
+        else:
+            chest_xray_model = load_chest_xray_model(model_path, num_classes, device)
+    else:
+        device = torch.device("cpu")
+        chest_xray_model = load_cxr_variant(model_path)
+    print(f"Chest X-Ray model loaded successfully ({mode}{', memory-mapped' if model_path == weights_path else ''}, "
+          f"version {bundle.version}).")
+    # The decode path changes the pixels the model sees, so it is part of the version
+    version = f"{bundle.version}:{file_version(model_path, extra=f'fast_decode={CXR_FAST_DECODE}')}"
+    return CXRModel(chest_xray_model, device, preprocess_cxr, CXRBatcher(chest_xray_model, device), version)
+
+
+class ModelRegistry:
+    """Named models that are loaded once, on first use, and timed for the startup report.
+
+    All models come from one version (a ModelBundle). load_version() loads and
+    warms a whole new version while the current one keeps serving, then
+    swaps every model in at once; requests already holding the old models
+    finish on them, and those are closed after MODEL_RETIRE_SECONDS.
+    """
+
+    def __init__(self, bundle=None):
+        self._loaders = {}
+        self._models = {}
+        self._load_seconds = {}
+        self._errors = {}
+        self._failed_at = {}
+        self._locks = {}
+        self._reload_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._reload_thread = None
+        self._checked_at = time.monotonic()
+        self._failed_version = None
+        self.bundle = bundle
+        self.reloads = 0
+        self.last_reload_error = None
+        self.created_at = time.perf_counter()
+        self.startup_seconds = None
+
+    def register(self, name, loader):
+        """loader(bundle) returns the model, or None when its files are absent."""
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    @property
+    def version(self):
+        if self.bundle is None:
+            try:
+                self.bundle = current_bundle()
+            except ModelStoreError as e:
+                print(f"Cannot use the live model version, serving local files: {e}")
+                self.bundle = local_bundle()
+        return self.bundle.version
+
+    def get(self, name):
+        """Return the loaded model, loading it on first call; None if it is unavailable.
+
+        A model whose files are absent stays None for this version; one whose
+        load raised is tried again MODEL_LOAD_RETRY_SECONDS later.
+        """
+        models = self._models
+        if name in models:
+            return models[name]
+        with self._locks[name]:
+            if name not in self._models:
+                failed_at = self._failed_at.get(name)
+                if failed_at is not None and time.monotonic() - failed_at < MODEL_LOAD_RETRY_SECONDS:
+                    return None
+                self.version  # resolve the bundle before the first load
+                start = time.perf_counter()
+                try:
+                    model = self._loaders[name](self.bundle)
+                except Exception as e:
+                    print(f"Failed to load {name} model: {e}")
+                    self._errors[name] = str(e)
+                    self._failed_at[name] = time.monotonic()
+                    self._load_seconds[name] = round(time.perf_counter() - start, 3)
+                    return None
+                self._models[name] = model
+                self._errors.pop(name, None)
+                self._failed_at.pop(name, None)
+                self._load_seconds[name] = round(time.perf_counter() - start, 3)
+        return self._models[name]
+
+    def is_loaded(self, name):
+        return self._models.get(name) is not None
+
+    def warmup(self):
+        for name in self._loaders:
+            self.get(name)
+
+    def load_version(self, bundle, warm=True):
+        """Load and warm every model of bundle, then swap them all in; raises and keeps the current ones on failure."""
+        with self._reload_lock:
+            models, load_seconds = {}, {}
+            for name, loader in self._loaders.items():
+                start = time.perf_counter()
+                model = loader(bundle)
+                if model is None and self.is_loaded(name):
+                    raise ModelStoreError(f"Version '{bundle.version}' has no {name} model")
+                if model is not None and warm and hasattr(model, 'warm'):
+                    model.warm()
+                models[name] = model
+                load_seconds[name] = round(time.perf_counter() - start, 3)
+
+            previous = self._models
+            self._models = models
+            self._load_seconds = load_seconds
+            self._errors = {}
+            self._failed_at = {}
+            self.bundle = bundle
+            self.reloads += 1
+            self.last_reload_error = None
+            print(f"Now serving model version '{bundle.version}'")
+
+        retired = [model for model in previous.values() if model is not None and hasattr(model, 'close')]
+        if retired:
+            timer = threading.Timer(MODEL_RETIRE_SECONDS, lambda: [model.close() for model in retired])
+            timer.daemon = True
+            timer.start()
+        return bundle.version
+
+    def reload(self, warm=True):
+        """Re-read the live version from the model store and swap it in."""
+        return self.load_version(current_bundle(), warm=warm)
+
+    def reload_in_background(self):
+        """Start reload() on a background thread unless one is already running."""
+        with self._thread_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self._reload_thread = threading.Thread(target=self._background_reload, name='model-reload', daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        except Exception as e:
+            self._failed_version = current_version()
+            self.last_reload_error = str(e)
+            print(f"Model reload failed, still serving '{self.version}': {e}")
+
+    def maybe_reload(self):
+        """Cheap per-request check: reload in the background if the live version changed."""
+        now = time.monotonic()
+        if now - self._checked_at < MODEL_STORE_POLL_SECONDS:
+            return False
+        self._checked_at = now
+        live = current_version()
+        if (live or local_bundle().version) == self.version or live == self._failed_version:
+            return False
+        return self.reload_in_background()
+
+    def mark_started(self, since=None):
+        """Record how long startup took, measured from `since` (a perf_counter value)."""
+        start = self.created_at if since is None else since
+        self.startup_seconds = round(time.perf_counter() - start, 3)
+        return self.startup_seconds
+
+    def report(self):
+        """Startup time, serving version and per-model load state, as shown by /health."""
+        models = {}
+        for name in self._loaders:
+            model = self._models.get(name)
+            models[name] = {
+                'loaded': model is not None,
+                'attempted': name in self._models or name in self._errors,
+                'load_seconds': self._load_seconds.get(name),
+                'version': getattr(model, 'version', None),
+            }
+            if name in self._errors:
+                models[name]['error'] = self._errors[name]
+        report = {
+            'startup_seconds': self.startup_seconds,
+            'version': self.version,
+            'reloads': self.reloads,
+            'models': models,
+        }
+        if self.last_reload_error:
+            report['last_reload_error'] = self.last_reload_error
+        return report
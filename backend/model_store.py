@@ -0,0 +1,244 @@
+"""
+Versioned model store.
+
+Each version is a directory under MODEL_STORE_DIR laid out like the backend
+directory itself (model.pkl, label_encoder.pkl, symptom_columns.pkl,
+model_flat/, models/cxr_model*.pt|.safetensors) plus a manifest.json with
+the SHA-256 of every file, so the symptom pickles can never be mixed across
+versions. The CURRENT file names the live version. Workers notice a change
+to CURRENT and swap the new version in (see ModelRegistry.load_version).
+
+When the store has no CURRENT version, models are served from the files in
+the backend directory, as before.
+
+Usage:
+    python model_store.py publish [--version NAME] [--activate]
+    python model_store.py activate NAME
+    python model_store.py list
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_STORE_DIR = os.environ.get('MODEL_STORE_DIR', os.path.join(BASE_DIR, 'model_store'))
+MODEL_STORE_POLL_SECONDS = float(os.environ.get('MODEL_STORE_POLL_SECONDS', 5))
+
+LOCAL_VERSION = 'local'
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'
+
+# Files and directories a version may contain, relative to its root
+BUNDLE_ENTRIES = ('model.pkl', 'label_encoder.pkl', 'symptom_columns.pkl', 'model_flat', 'models', 'training_report.json')
+
+
+class ModelStoreError(Exception):
+    """A version is missing, incomplete or does not match its manifest."""
+
+
+class ModelBundle:
+    """The model files of one version: a root directory laid out like the backend directory."""
+
+    def __init__(self, root, version):
+        self.root = root
+        self.version = version
+
+    @property
+    def symptom_model_path(self):
+        return os.path.join(self.root, 'model.pkl')
+
+    @property
+    def label_encoder_path(self):
+        return os.path.join(self.root, 'label_encoder.pkl')
+
+    @property
+    def symptom_columns_path(self):
+        return os.path.join(self.root, 'symptom_columns.pkl')
+
+    @property
+    def flat_forest_path(self):
+        return os.path.join(self.root, 'model_flat')
+
+    @property
+    def cxr_model_path(self):
+        return os.path.join(self.root, 'models', 'cxr_model.pt')
+
+
+def local_bundle():
+    return ModelBundle(BASE_DIR, LOCAL_VERSION)
+
+
+def version_dir(version, store_dir=MODEL_STORE_DIR):
+    if not version or os.sep in version or version.startswith('.'):
+        raise ModelStoreError(f"Invalid model version name '{version}'")
+    return os.path.join(store_dir, version)
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Entries a new version may take from the live one when its source lacks them
+# (the symptom model files must always come together from the source)
+INHERITABLE_ENTRIES = ('models',)
+
+
+def _bundle_files(root, entries=BUNDLE_ENTRIES):
+    for entry in entries:
+        path = os.path.join(root, entry)
+        if os.path.isfile(path):
+            yield entry
+        elif os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    yield os.path.relpath(os.path.join(dirpath, filename), root)
+
+
+def _link_or_copy(source, destination):
+    # Versions are immutable, so unchanged files can share one inode
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def read_manifest(version, store_dir=MODEL_STORE_DIR):
+    path = os.path.join(version_dir(version, store_dir), MANIFEST_NAME)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise ModelStoreError(f"Cannot read manifest of version '{version}': {e}")
+
+
+def verify_version(version, store_dir=MODEL_STORE_DIR):
+    """Check every file of a version against its manifest and return its bundle."""
+    root = version_dir(version, store_dir)
+    manifest = read_manifest(version, store_dir)
+    for relpath, expected in manifest.get('files', {}).items():
+        path = os.path.join(root, relpath)
+        if not os.path.isfile(path):
+            raise ModelStoreError(f"Version '{version}' is missing {relpath}")
+        if sha256_file(path) != expected:
+            raise ModelStoreError(f"Version '{version}': {relpath} does not match its manifest checksum")
+    return ModelBundle(root, version)
+
+
+def list_versions(store_dir=MODEL_STORE_DIR):
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(name for name in os.listdir(store_dir)
+                  if os.path.isfile(os.path.join(store_dir, name, MANIFEST_NAME)))
+
+
+def current_version(store_dir=MODEL_STORE_DIR):
+    """Name of the live version, or None when serving the backend directory's files."""
+    try:
+        with open(os.path.join(store_dir, CURRENT_NAME), 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def current_bundle(store_dir=MODEL_STORE_DIR):
+    version = current_version(store_dir)
+    if version is None:
+        return local_bundle()
+    return verify_version(version, store_dir)
+
+
+def activate(version, store_dir=MODEL_STORE_DIR):
+    """Verify a version and atomically point CURRENT at it."""
+    verify_version(version, store_dir)
+    tmp_path = os.path.join(store_dir, f".{CURRENT_NAME}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(store_dir, CURRENT_NAME))
+
+
+def publish(source_dir=BASE_DIR, version=None, store_dir=MODEL_STORE_DIR, inherit_dir=None, metadata=None):
+    """Copy the model files of source_dir into a new version directory with its manifest.
+
+    Chest X-ray weights missing from source_dir are taken from inherit_dir
+    (e.g. the live version's root), so retraining one model keeps the other.
+    """
+    version = version or datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    target = version_dir(version, store_dir)
+    if os.path.exists(target):
+        raise ModelStoreError(f"Version '{version}' already exists")
+
+    # Written under a temporary name and renamed, so a half-copied version is never listed
+    staging = os.path.join(store_dir, f".{version}.staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    sources = [(source_dir, relpath) for relpath in _bundle_files(source_dir)]
+    if inherit_dir:
+        missing = [entry for entry in INHERITABLE_ENTRIES if not os.path.exists(os.path.join(source_dir, entry))]
+        sources += [(inherit_dir, relpath) for relpath in _bundle_files(inherit_dir, missing)]
+
+    files = {}
+    for root, relpath in sources:
+        destination = os.path.join(staging, relpath)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if root == source_dir:
+            shutil.copy2(os.path.join(root, relpath), destination)
+        else:
+            _link_or_copy(os.path.join(root, relpath), destination)
+        files[relpath] = sha256_file(destination)
+    if 'symptom_columns.pkl' not in files:
+        shutil.rmtree(staging)
+        raise ModelStoreError(f"No symptom model files found in {source_dir}")
+
+    manifest = {'version': version, 'created_at': datetime.utcnow().isoformat(), 'files': files}
+    if metadata:
+        manifest['metadata'] = metadata
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, target)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage versioned model bundles.")
+    parser.add_argument('--store', default=MODEL_STORE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_cmd = commands.add_parser('publish', help="copy the current model files into a new version")
+    publish_cmd.add_argument('--source', default=BASE_DIR)
+    publish_cmd.add_argument('--version')
+    publish_cmd.add_argument('--activate', action='store_true')
+    activate_cmd = commands.add_parser('activate', help="make a version live")
+    activate_cmd.add_argument('version')
+    commands.add_parser('list', help="list versions")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'publish':
+            os.makedirs(args.store, exist_ok=True)
+            manifest = publish(args.source, args.version, args.store)
+            print(f"Published version '{manifest['version']}' ({len(manifest['files'])} files)")
+            if args.activate:
+                activate(manifest['version'], args.store)
+                print(f"Activated version '{manifest['version']}'")
+        elif args.command == 'activate':
+            activate(args.version, args.store)
+            print(f"Activated version '{args.version}'")
+        else:
+            live = current_version(args.store)
+            for version in list_versions(args.store):
+                print(f"{'*' if version == live else ' '} {version}")
+    except ModelStoreError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
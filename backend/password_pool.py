@@ -0,0 +1,131 @@
+"""
+Bounded worker pool for bcrypt.
+
+bcrypt releases the GIL while hashing, so running it on a small dedicated
+pool caps how many cores password work can take at once. When the pool and
+its queue are full, callers get PoolSaturated immediately (HTTP 429) instead
+of piling up and starving inference requests; work that does not finish in
+time raises PoolTimeout (HTTP 503).
+
+A forked child (a gunicorn worker of the preloaded app) gets a fresh pool:
+the threads of the parent's pool do not exist in the child.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_POOL_MAX_PENDING = int(os.environ.get('PASSWORD_POOL_MAX_PENDING', 16))
+PASSWORD_POOL_TIMEOUT_SECONDS = float(os.environ.get('PASSWORD_POOL_TIMEOUT_SECONDS', 10))
+
+
+class PoolBusy(Exception):
+    """The password pool could not do the work now; the client should retry."""
+
+
+class PoolSaturated(PoolBusy):
+    """Raised when the password pool already has as much work as it will queue."""
+
+
+class PoolTimeout(PoolBusy):
+    """Raised when queued password work did not finish within the timeout."""
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor that rejects work beyond workers + max_pending in flight."""
+
+    def __init__(self, workers=PASSWORD_POOL_WORKERS, max_pending=PASSWORD_POOL_MAX_PENDING,
+                 name='password-hash'):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_pending)
+        self.name = name
+        self._reset()
+
+    def _reset(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def after_fork(self):
+        """Replace the executor in a forked child.
+
+        The inherited one counts the parent's threads as idle workers, so work
+        submitted to it in the child would never run.
+        """
+        self._reset()
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated("Password hashing is at capacity, please retry shortly.")
+        with self._lock:
+            self.in_flight += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args, timeout=PASSWORD_POOL_TIMEOUT_SECONDS):
+        """Run fn on the pool and wait for its result."""
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Drops the work if it has not started yet; a running hash finishes unobserved
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise PoolTimeout("Password hashing is taking too long, please retry shortly.")
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'capacity': self.capacity,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+        }
+
+
+password_pool = BoundedExecutor()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=password_pool.after_fork)
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_password_pooled(password, rounds=BCRYPT_ROUNDS):
+    return password_pool.run(_hashpw, password, rounds)
+
+
+def verify_password_pooled(password, hashed):
+    return password_pool.run(_checkpw, password, hashed)
+
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash such as '$2b$12$...'; None if it cannot be parsed."""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed, rounds=BCRYPT_ROUNDS):
+    return hash_rounds(hashed) != rounds
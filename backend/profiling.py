@@ -0,0 +1,261 @@
+"""
+On-demand profiling of a live worker.
+
+An admin can profile a single request by sending it with `X-Profile: 1`
+(and their bearer token), or every thread of the worker for a time window
+with POST /admin/profile. A sampling profiler records the Python stacks,
+written in the folded format read by flamegraph.pl, speedscope and
+inferno; a profiled /analyze-image request also gets a torch profiler
+trace of its chest X-ray forward pass. Profiles are stored in PROFILE_DIR
+and downloaded from GET /admin/profiles/<name>.
+
+When nothing is being profiled the only cost is one header lookup per request.
+"""
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+from flask import g, jsonify, request, send_from_directory
+
+from auth_simple import ADMIN_EMAILS, require_admin, verify_token
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'medical-api-profiles'))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 2))
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 60))
+
+PROFILE_HEADER = 'X-Profile'
+
+_sequence = 0
+_sequence_lock = threading.Lock()
+
+
+def profile_name(kind):
+    """Unique file stem, e.g. request-analyze_image-20240601T120000-4242-3."""
+    global _sequence
+    with _sequence_lock:
+        _sequence += 1
+        sequence = _sequence
+    return f"{kind}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{sequence}"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """Samples the Python stacks of some (or all) threads from a background thread.
+
+    Stacks are counted root first, as folded-format lines "a;b;c <samples>".
+    """
+
+    def __init__(self, thread_ids=None, interval_ms=PROFILE_SAMPLE_INTERVAL_MS, label_threads=False):
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.interval = max(0.0005, interval_ms / 1000.0)
+        self.label_threads = label_threads
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()} if self.label_threads else {}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if self.label_threads:
+                    stack.append(names.get(thread_id, str(thread_id)))
+                self.counts[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        """Write the folded stacks atomically; returns path."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+        return path
+
+
+class RequestProfile:
+    """The sampler and file names of one profiled request."""
+
+    def __init__(self, endpoint):
+        self.name = profile_name(f"request-{endpoint or 'unmatched'}")
+        self.sampler = StackSampler(thread_ids=[threading.get_ident()]).start()
+
+    @property
+    def torch_trace_path(self):
+        """Path prefix for the torch profiler output of this request's forward pass."""
+        return os.path.join(PROFILE_DIR, f"{self.name}.torch")
+
+    def finish(self):
+        self.sampler.stop()
+        return self.sampler.write(os.path.join(PROFILE_DIR, f"{self.name}.folded"))
+
+
+def write_torch_profile(prof, path):
+    """Write a torch profiler run as path.json (Chrome trace) and path.folded (op stacks in microseconds)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    prof.export_chrome_trace(f"{path}.json")
+
+    # Nesting of aten ops, weighted by self CPU time, in the same folded format as the samples
+    counts = Counter()
+    for event in prof.events():
+        stack, parent = [], event
+        while parent is not None:
+            stack.append(parent.name.replace(';', ','))
+            parent = parent.cpu_parent
+        counts[';'.join(reversed(stack))] += int(event.self_cpu_time_total)
+    with open(f"{path}.folded", 'w') as f:
+        for stack, micros in counts.most_common():
+            if micros > 0:
+                f.write(f"{stack} {micros}\n")
+
+
+def current_torch_trace_path():
+    """Where the current request's forward pass should be traced, or None when it is not profiled."""
+    profile = g.get('request_profile')
+    return profile.torch_trace_path if profile is not None else None
+
+
+def _is_admin_request():
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        token = token[7:]
+    payload = verify_token(token) if token else None
+    return payload is not None and payload['email'] in ADMIN_EMAILS
+
+
+def _finish_request_profile():
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return None
+    try:
+        return profile.finish()
+    except OSError as e:
+        print(f"Could not write profile {profile.name}: {e}")
+        return None
+
+
+class WindowProfile:
+    """Samples every thread of this worker for a fixed number of seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = None
+
+    def start(self, seconds):
+        with self._lock:
+            if self.active is not None:
+                return None
+            name = profile_name('window')
+            sampler = StackSampler(label_threads=True).start()
+            self.active = name
+        timer = threading.Timer(seconds, self._finish, args=(name, sampler))
+        timer.daemon = True
+        timer.start()
+        return name
+
+    def _finish(self, name, sampler):
+        sampler.stop()
+        try:
+            sampler.write(os.path.join(PROFILE_DIR, f"{name}.folded"))
+            print(f"Profile {name} written ({sampler.samples} samples)")
+        except OSError as e:
+            print(f"Could not write profile {name}: {e}")
+        finally:
+            with self._lock:
+                self.active = None
+
+
+window_profile = WindowProfile()
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(PROFILE_DIR)):
+        path = os.path.join(PROFILE_DIR, filename)
+        if filename.endswith('.tmp') or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        profiles.append({
+            'name': filename,
+            'bytes': stat.st_size,
+            'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat(),
+        })
+    return profiles
+
+
+def init_profiling(app):
+    @app.before_request
+    def start_request_profile():
+        if not request.headers.get(PROFILE_HEADER):
+            return
+        if _is_admin_request():
+            g.request_profile = RequestProfile(request.endpoint)
+
+    @app.after_request
+    def attach_request_profile(response):
+        path = _finish_request_profile()
+        if path is not None:
+            response.headers['X-Profile-Id'] = os.path.basename(path)
+        return response
+
+    @app.teardown_request
+    def discard_request_profile(exc=None):
+        # Only reached with a profile still running when the request failed
+        _finish_request_profile()
+
+    @app.route('/admin/profile', methods=['POST'])
+    @require_admin
+    def start_window_profile():
+        """Sample every thread of the worker that receives this for `seconds`."""
+        data = request.get_json(silent=True) or {}
+        try:
+            seconds = float(data.get('seconds', 10))
+        except (TypeError, ValueError):
+            return jsonify({"error": "seconds must be a number"}), 400
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            return jsonify({"error": f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}"}), 400
+
+        name = window_profile.start(seconds)
+        if name is None:
+            return jsonify({"error": "A profile is already running in this worker", "profile": window_profile.active}), 409
+        return jsonify({'profile': f"{name}.folded", 'seconds': seconds, 'pid': os.getpid()}), 202
+
+    @app.route('/admin/profiles', methods=['GET'])
+    @require_admin
+    def get_profiles():
+        return jsonify({'profiles': list_profiles(), 'running': window_profile.active})
+
+    @app.route('/admin/profiles/<name>', methods=['GET'])
+    @require_admin
+    def download_profile(name):
+        return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+    return app
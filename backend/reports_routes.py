@@ -1,11 +1,76 @@
+import base64
+import json
+import os
+from datetime import datetime
+
 from flask import request, jsonify
-from auth_simple import require_auth, get_user_by_id
+from sqlalchemy import and_, or_
+from auth_simple import require_auth, get_user_by_id, session_scope, DiagnosisReport
+
+# Page size for GET /api/reports; the next page's cursor is sent in X-Next-Cursor
+REPORTS_PAGE_SIZE = int(os.environ.get('REPORTS_PAGE_SIZE', 50))
+REPORTS_MAX_PAGE_SIZE = int(os.environ.get('REPORTS_MAX_PAGE_SIZE', 200))
+REPORTS_MAX_BULK_INSERT = int(os.environ.get('REPORTS_MAX_BULK_INSERT', 500))
+
+# Set by the server, never taken from the stored report body
+RESERVED_FIELDS = ('id', 'user_id', 'created_at')
+
+
+def encode_cursor(report):
+    payload = json.dumps([report.created_at.isoformat(), report.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(report_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
 
-# Store reports in memory (in a real app, this would be in a database)
-diagnosis_reports = {}
 
-def get_user_reports():
-    return diagnosis_reports
+def serialize_report(report, fields=None):
+    data = dict(report.data)
+    data['id'] = str(report.id)
+    data['user_id'] = report.user_id
+    data['created_at'] = report.created_at.isoformat()
+    if fields:
+        data = {key: value for key, value in data.items() if key in fields or key == 'id'}
+    return data
+
+
+def create_reports(user_id, report_bodies):
+    """Insert one or more reports in a single transaction; IDs come from the database."""
+    with session_scope() as db:
+        try:
+            now = datetime.utcnow()
+            reports = []
+            for body in report_bodies:
+                data = {key: value for key, value in body.items() if key not in RESERVED_FIELDS}
+                reports.append(DiagnosisReport(user_id=user_id, created_at=now, data=data))
+            db.add_all(reports)
+            db.commit()
+            return reports
+        except Exception:
+            db.rollback()
+            raise
+
+
+def list_reports(user_id, limit=REPORTS_PAGE_SIZE, cursor=None):
+    """Return (reports, next_cursor) for one user, newest first."""
+    with session_scope() as db:
+        query = db.query(DiagnosisReport).filter(DiagnosisReport.user_id == user_id)
+        if cursor:
+            created_at, report_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                DiagnosisReport.created_at < created_at,
+                and_(DiagnosisReport.created_at == created_at, DiagnosisReport.id < report_id),
+            ))
+        rows = (query.order_by(DiagnosisReport.created_at.desc(), DiagnosisReport.id.desc())
+                .limit(limit + 1).all())
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
 
 def init_reports_routes(app):
     @app.route('/api/reports', methods=['POST'])
@@ -15,15 +80,21 @@ def init_reports_routes(app):
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        report_data = request.json
-        report_data['id'] = str(len(diagnosis_reports.get(request.user_id, [])) + 1)
-        report_data['user_id'] = request.user_id
+        # A single report object, or a list of them for bulk insert
+        payload = request.json
+        bodies = payload if isinstance(payload, list) else [payload]
+        if not bodies or not all(isinstance(body, dict) for body in bodies):
+            return jsonify({"error": "Report must be a JSON object or a list of objects"}), 400
+        if len(bodies) > REPORTS_MAX_BULK_INSERT:
+            return jsonify({"error": f"At most {REPORTS_MAX_BULK_INSERT} reports per request"}), 400
 
-        if request.user_id not in diagnosis_reports:
-            diagnosis_reports[request.user_id] = []
+        try:
+            reports = create_reports(request.user_id, bodies)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
 
-        diagnosis_reports[request.user_id].append(report_data)
-        return jsonify(report_data), 201
+        saved = [serialize_report(report) for report in reports]
+        return jsonify(saved if isinstance(payload, list) else saved[0]), 201
 
     @app.route('/api/reports', methods=['GET'])
     @require_auth
@@ -32,7 +103,21 @@ def init_reports_routes(app):
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        user_reports = diagnosis_reports.get(request.user_id, [])
-        return jsonify(user_reports)
+        try:
+            limit = int(request.args.get('limit', REPORTS_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, REPORTS_MAX_PAGE_SIZE))
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+
+        try:
+            reports, next_cursor = list_reports(request.user_id, limit, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        response = jsonify([serialize_report(report, fields) for report in reports])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
 
     return app
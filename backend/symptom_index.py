@@ -0,0 +1,89 @@
+import json
+import os
+import re
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYMPTOM_ALIASES_PATH = os.environ.get('SYMPTOM_ALIASES_PATH', os.path.join(BASE_DIR, 'symptom_aliases.json'))
+
+# Common lay terms and spellings mapped onto the model's symptom columns
+SYMPTOM_ALIASES = {
+    'fever': ['high_temperature', 'temperature', 'pyrexia', 'feverish'],
+    'cough': ['coughing'],
+    'headache': ['head_ache', 'head_pain'],
+    'nausea': ['nauseous', 'feeling_sick'],
+    'fatigue': ['tiredness', 'tired', 'exhaustion', 'weakness'],
+    'runny_nose': ['running_nose', 'nose_running', 'rhinorrhea'],
+    'sore_throat': ['throat_pain', 'scratchy_throat'],
+    'muscle_aches': ['muscle_ache', 'muscle_pain', 'body_aches', 'body_ache', 'myalgia'],
+    'chills': ['shivering', 'shivers'],
+    'vomiting': ['throwing_up', 'vomit'],
+    'diarrhea': ['diarrhoea', 'loose_stools'],
+    'shortness_of_breath': ['short_of_breath', 'breathlessness', 'difficulty_breathing', 'dyspnea'],
+    'chest_pain': ['chest_ache', 'chest_tightness'],
+    'sneezing': ['sneeze', 'sneezes'],
+    'nasal_congestion': ['stuffy_nose', 'blocked_nose', 'congestion'],
+}
+
+_SEPARATORS = re.compile(r'[\s\-]+')
+
+
+def normalize_symptom(name):
+    """Normalize a symptom name: 'Runny-Nose ' -> 'runny_nose'."""
+    return _SEPARATORS.sub('_', str(name).strip().lower()).strip('_')
+
+
+def load_symptom_aliases(path=SYMPTOM_ALIASES_PATH):
+    """Return the built-in aliases merged with an optional JSON file of extra aliases."""
+    aliases = {column: list(names) for column, names in SYMPTOM_ALIASES.items()}
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            for column, names in json.load(f).items():
+                aliases.setdefault(column, []).extend(names)
+    return aliases
+
+
+class SymptomIndex:
+    """Normalized symptom name (or alias) -> model column index, built once at load time."""
+
+    def __init__(self, symptom_columns, aliases=None):
+        self.num_features = len(symptom_columns)
+        self._index = {}
+        for i, column in enumerate(symptom_columns):
+            self._index[normalize_symptom(column)] = i
+
+        if aliases is None:
+            aliases = load_symptom_aliases()
+        for column, names in aliases.items():
+            i = self._index.get(normalize_symptom(column))
+            if i is None:
+                continue
+            for name in names:
+                # Never let an alias shadow a real column name
+                self._index.setdefault(normalize_symptom(name), i)
+
+    def lookup(self, symptom):
+        """Return the column index for a user-supplied symptom, or None if unknown."""
+        return self._index.get(normalize_symptom(symptom))
+
+    def resolve(self, user_symptoms):
+        """Return the sorted, de-duplicated column indices a symptom list maps to."""
+        return sorted({i for i in map(self.lookup, user_symptoms) if i is not None})
+
+    def vectorize_batch(self, symptom_lists):
+        """Build an N x F binary matrix in O(total symptoms)."""
+        rows, cols = [], []
+        for row, user_symptoms in enumerate(symptom_lists):
+            for symptom in user_symptoms:
+                i = self.lookup(symptom)
+                if i is not None:
+                    rows.append(row)
+                    cols.append(i)
+        matrix = np.zeros((len(symptom_lists), self.num_features))
+        matrix[rows, cols] = 1
+        return matrix
+
+    def matching_symptoms(self, user_symptoms):
+        """Return the user's symptoms that the model recognises, in their original spelling."""
+        return [s for s in user_symptoms if self.lookup(s) is not None]
@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# The backend modules are imported flat, as the app and gunicorn import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read at import time, so they are set before any test imports the app
+WORKDIR = tempfile.mkdtemp(prefix='medical-api-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['GEMINI_API_KEY'] = ''
+os.environ['ADMIN_EMAILS'] = 'admin@test.local'
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ['MODEL_STORE_DIR'] = os.path.join(WORKDIR, 'model_store')
+os.environ['RESULT_CACHE_DIR'] = ''
+os.environ['JOB_QUEUE_DB'] = os.path.join(WORKDIR, 'jobs.sqlite3')
+os.environ['JOB_DATA_DIR'] = os.path.join(WORKDIR, 'jobs')
+os.environ['CHAT_INDEX_DIR'] = os.path.join(WORKDIR, 'chat_index')
+os.environ['PROFILE_DIR'] = os.path.join(WORKDIR, 'profiles')
+os.environ['BULK_ANALYSIS_ROOT'] = os.path.join(WORKDIR, 'bulk')
+os.environ['BULK_CHECKPOINT_DIR'] = os.path.join(WORKDIR, 'bulk-checkpoints')
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def signup(client):
+    """signup(email=None) creates an account and returns its Authorization headers."""
+    def create(email=None, password='secret-password'):
+        email = email or f"user-{uuid.uuid4().hex[:8]}@test.local"
+        response = client.post('/auth/signup', json={
+            'username': f"{email.split('@')[0]}-{uuid.uuid4().hex[:4]}", 'email': email, 'password': password})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': f"Bearer {response.get_json()['token']}"}
+    return create
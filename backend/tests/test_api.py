@@ -0,0 +1,69 @@
+from auth_simple import pool_stats
+
+
+def ranking(result):
+    return [(p['disease'], p['confidence']) for p in result['predictions']]
+
+
+def test_predict_batch_matches_single_predictions(client):
+    symptom_sets = [['fever', 'cough'], ['headache', 'nausea', 'vomiting'], ['Runny Nose', 'sneezing']]
+    single = [client.post('/predict', json={'symptoms': symptoms}).get_json() for symptoms in symptom_sets]
+
+    response = client.post('/predict/batch', json={'items': [{'symptoms': s} for s in symptom_sets] + [{}]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results[:3] == single
+    assert 'error' in results[3]
+
+
+def test_predict_rejects_missing_symptoms(client):
+    assert client.post('/predict', json={'symptoms': []}).status_code == 400
+    assert client.post('/predict/batch', json={'items': []}).status_code == 400
+
+
+def test_repeated_predict_is_served_from_the_cache(client):
+    from app import result_cache
+    payload = {'symptoms': ['chills', 'muscle_aches', 'fatigue']}
+    first = client.post('/predict', json=payload).get_json()
+    hits = result_cache.stats()['memory']['hits']
+    # Same columns in another order and spelling resolve to the same key
+    second = client.post('/predict', json={'symptoms': ['Fatigue', 'chills', 'muscle aches']}).get_json()
+    assert ranking(second) == ranking(first)
+    assert result_cache.stats()['memory']['hits'] == hits + 1
+
+
+def test_profile_update_is_visible_through_the_user_cache(client, signup):
+    headers = signup()
+    assert client.get('/auth/me', headers=headers).status_code == 200
+    response = client.put('/api/user/profile', headers=headers, json={'name': 'renamed'})
+    assert response.status_code == 200
+    assert client.get('/auth/me', headers=headers).get_json()['user']['username'] == 'renamed'
+
+
+def test_login_and_invalid_tokens(client, signup):
+    signup('login@test.local')
+    response = client.post('/auth/login', json={'email': 'login@test.local', 'password': 'secret-password'})
+    assert response.status_code == 200
+    assert client.post('/auth/login', json={'email': 'login@test.local', 'password': 'wrong'}).status_code == 401
+    assert client.get('/auth/me', headers={'Authorization': 'Bearer nope'}).status_code == 401
+
+
+def test_requests_return_their_connections_to_the_pool(client, signup):
+    headers = signup()
+    for _ in range(3):
+        client.get('/api/reports', headers=headers)
+        client.get('/auth/me', headers=headers)
+    assert pool_stats().get('checked_out', 0) == 0
+
+
+def test_health_and_metrics(client):
+    client.post('/predict', json={'symptoms': ['fever']})
+    health = client.get('/health').get_json()
+    assert health['status'] == 'healthy'
+    assert health['model_loaded'] is True
+
+    metrics = client.get('/metrics')
+    assert metrics.status_code == 200
+    text = metrics.get_data(as_text=True)
+    assert 'http_requests_total{endpoint="predict",method="POST",status="200"}' in text
+    assert 'request_stage_duration_seconds_count{endpoint="predict",stage="predict_proba"}' in text
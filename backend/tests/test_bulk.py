@@ -0,0 +1,123 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import analyze_image
+from analyze_image import CLASS_NAMES, Checkpoint, analyze_chest_xray, run_bulk
+
+PROBABILITY = 0.123456
+
+
+class FakeBatcher:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def predict_many(self, tensors):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("device lost")
+        return [np.full(len(CLASS_NAMES), PROBABILITY, dtype=np.float32) for _ in tensors]
+
+
+class FakeCXR:
+    """Stands in for the chest X-ray model, whose weights are not in the repo; the first `failures` batches fail."""
+
+    version = 'test'
+
+    def __init__(self, failures=0):
+        self.batcher = FakeBatcher(failures)
+
+    def transform(self, image):
+        return image.size
+
+
+def write_images(directory, count):
+    os.makedirs(directory, exist_ok=True)
+    names = [f"p{n:03d}.png" for n in range(count)]
+    for name in names:
+        Image.new('L', (16, 16), color=100).save(os.path.join(directory, name))
+    return names
+
+
+def read_lines(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+class Output:
+    def __init__(self):
+        self.text = ''
+
+    def write(self, text):
+        self.text += text
+
+    def flush(self):
+        pass
+
+
+def run(source, checkpoint_path, cxr):
+    output = Output()
+    checkpoint = Checkpoint(checkpoint_path)
+    try:
+        summary = run_bulk(source, output, checkpoint, cxr, batch_size=2, decode_threads=1)
+    finally:
+        checkpoint.close()
+    return read_lines(output.text), summary
+
+
+def test_resume_retries_images_whose_inference_failed(tmp_path):
+    source = str(tmp_path / 'study')
+    names = write_images(source, 4)
+    checkpoint_path = str(tmp_path / 'run.checkpoint')
+
+    records, summary = run(source, checkpoint_path, FakeCXR(failures=1))
+    failed = {record['source'] for record in records if 'error' in record}
+    assert len(failed) == 2 and summary['errors'] == 2
+    assert all(record['error'].startswith('Inference failed') for record in records if 'error' in record)
+    # Only the analyzed images are recorded as done
+    assert Checkpoint(checkpoint_path).done == set(names) - failed
+
+    records, summary = run(source, checkpoint_path, FakeCXR())
+    assert {record['source'] for record in records} == failed
+    assert summary['errors'] == 0 and summary['skipped'] == 2
+    assert len(Checkpoint(checkpoint_path).done) == 4
+
+    records, summary = run(source, checkpoint_path, FakeCXR())
+    assert records == [] and summary['skipped'] == 4
+
+
+def test_rounding_is_only_applied_to_ndjson_output(tmp_path, monkeypatch):
+    source = str(tmp_path / 'study')
+    names = write_images(source, 1)
+    monkeypatch.setattr(analyze_image, '_model', FakeCXR())
+
+    predictions = analyze_chest_xray(os.path.join(source, names[0]), threshold=0.1)
+    assert predictions[0]['probability'] == pytest.approx(PROBABILITY, abs=1e-7)
+    assert predictions[0]['probability'] != round(PROBABILITY, 4)
+
+    records, _ = run(source, str(tmp_path / 'run.checkpoint'), FakeCXR())
+    assert set(records[0]['probabilities'].values()) == {round(PROBABILITY, 4)}
+
+
+def test_bulk_endpoint_resumes_after_a_failed_batch(client, signup, monkeypatch):
+    from app import model_registry
+    from bulk_routes import BULK_ANALYSIS_ROOT
+    write_images(os.path.join(BULK_ANALYSIS_ROOT, 'endpoint'), 4)
+    cxr = FakeCXR(failures=1)
+    monkeypatch.setattr(model_registry, 'get', lambda name: cxr)
+
+    assert client.post('/analyze-image/bulk', headers=signup(), json={'source': 'endpoint'}).status_code == 403
+
+    headers = signup('admin@test.local')
+    body = {'source': 'endpoint', 'resume': True, 'threshold': 0.1}
+    first = read_lines(client.post('/analyze-image/bulk', headers=headers, json=body).get_data(as_text=True))
+    assert first[-1]['summary']['errors'] > 0
+    failed = {record['source'] for record in first[:-1] if 'error' in record}
+
+    second = read_lines(client.post('/analyze-image/bulk', headers=headers, json=body).get_data(as_text=True))
+    assert {record['source'] for record in second[:-1]} == failed
+    assert second[-1]['summary']['errors'] == 0
+    assert second[-1]['summary']['skipped'] == 4 - len(failed)
@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from chat_index import ChatRetrieval
+from chat_kb import chat_kb
+
+
+def intent_answer(intent_id):
+    return next(intent['answer'] for intent in chat_kb.intents if intent['id'] == intent_id)
+
+
+def ask(client, question):
+    response = client.post('/chat', json={'question': question})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.mark.parametrize('question, intent_id', [
+    ("my heart hurts", 'heart'),
+    ("what should I eat for immunity", 'immunity'),
+    ("how do I avoid influenza", 'flu'),
+])
+def test_keyword_intent_wins_over_retrieval(client, question, intent_id):
+    assert ask(client, question)['answer'].startswith(intent_answer(intent_id))
+
+
+def test_paraphrase_without_keywords_is_answered_by_retrieval(client):
+    data = ask(client, "signs of high blood sugar")
+    assert data['answer'].startswith(intent_answer('diabetes'))
+    assert data['confidence'] > 0
+
+
+def write_kb(path, answer):
+    with open(path, 'w') as f:
+        json.dump({'intents': [{'id': 'sleep', 'keywords': ['sleep'], 'answer': answer,
+                                'questions': ['How many hours should I rest at night?']}]}, f)
+
+
+def test_index_is_rebuilt_when_the_knowledge_base_changes(tmp_path):
+    kb_path = str(tmp_path / 'kb.json')
+    index_root = str(tmp_path / 'index')
+    write_kb(kb_path, "Adults need 7-9 hours.")
+    retrieval = ChatRetrieval(kb_path, '', index_root, reload_seconds=0)
+    assert retrieval.best_answer("hours of rest at night")[0] == "Adults need 7-9 hours."
+    first_dir = retrieval.index.index_dir
+
+    write_kb(kb_path, "Most adults need 7 to 9 hours of sleep.")
+    os.utime(kb_path, (1, 1))
+    assert retrieval.best_answer("hours of rest at night")[0] == "Most adults need 7 to 9 hours of sleep."
+    assert retrieval.reloads == 1
+    # The old build is pruned; the new one is named after the new contents
+    assert os.listdir(index_root) == [os.path.basename(retrieval.index.index_dir)]
+    assert retrieval.index.index_dir != first_dir
+
+
+def test_same_sources_reuse_the_existing_build(tmp_path):
+    kb_path = str(tmp_path / 'kb.json')
+    index_root = str(tmp_path / 'index')
+    write_kb(kb_path, "Adults need 7-9 hours.")
+    first = ChatRetrieval(kb_path, '', index_root)
+    second = ChatRetrieval(kb_path, '', index_root)
+    assert first.index.index_dir == second.index.index_dir
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import torch
+
+from cxr_batcher import CXRBatcher, InferenceTimeout
+
+
+class TinyModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(3 * 4 * 4, 2)
+
+    def forward(self, x):
+        return self.linear(x.flatten(1))
+
+
+class SlowModel(TinyModel):
+    def forward(self, x):
+        time.sleep(1)
+        return super().forward(x)
+
+
+def predict_concurrently(batcher, tensors):
+    results = [None] * len(tensors)
+    barrier = threading.Barrier(len(tensors))
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = batcher.predict(tensors[index])
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(tensors))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_share_batches():
+    batcher = CXRBatcher(TinyModel(), 'cpu', max_batch_size=4, max_delay_ms=50)
+    results = predict_concurrently(batcher, [torch.rand(3, 4, 4) for _ in range(4)])
+    batcher.close()
+    assert all(probs.shape == (2,) for probs in results)
+
+
+def test_malformed_image_only_fails_its_own_request():
+    batcher = CXRBatcher(TinyModel(), 'cpu', max_batch_size=4, max_delay_ms=50)
+    tensors = [torch.rand(3, 4, 4), torch.rand(1, 4, 4), torch.rand(3, 4, 4), torch.rand(3, 4, 4)]
+    results = predict_concurrently(batcher, tensors)
+    batcher.close()
+    assert isinstance(results[1], RuntimeError)
+    assert all(results[i].shape == (2,) for i in (0, 2, 3))
+
+
+def test_stalled_forward_times_out():
+    batcher = CXRBatcher(SlowModel(), 'cpu')
+    with pytest.raises(InferenceTimeout):
+        batcher.predict(torch.rand(3, 4, 4), timeout=0.1)
+    batcher.close()
+
+
+def test_importing_the_batcher_does_not_load_torch():
+    # app.py imports InferenceTimeout at startup, before any model is loaded
+    code = "import sys, cxr_batcher; sys.exit('torch' in sys.modules)"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, '-c', code], cwd=backend).returncode == 0
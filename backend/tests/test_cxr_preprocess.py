@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from cxr_preprocess import compare_with_transform
+
+# Fast decode tolerance, in normalized units (one gray level is about 0.017)
+FAST_MEAN_TOLERANCE = 0.03
+FAST_MAX_TOLERANCE = 0.25
+
+
+def synthetic_scan(mode, size, seed=0):
+    """Smooth anatomy-like shading plus noise, the hard case for reduced-resolution decoding."""
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    noise = np.random.default_rng(seed).normal(0, 20, (height, width))
+    gray = (127 + 100 * np.sin(x / 37.0) * np.cos(y / 53.0) + noise).clip(0, 255).astype(np.uint8)
+    if mode == 'L':
+        return Image.fromarray(gray, 'L')
+    return Image.fromarray(np.stack([gray, np.roll(gray, 7, axis=1), 255 - gray], axis=-1), 'RGB')
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB'])
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+@pytest.mark.parametrize('size', [(2500, 2048), (1024, 900), (320, 320), (200, 150)])
+def test_preprocessing_matches_the_reference_transform(tmp_path, mode, fmt, size):
+    path = str(tmp_path / f"scan.{fmt.lower()}")
+    synthetic_scan(mode, size).save(path, format=fmt)
+
+    exact_max, fast_mean, fast_max = compare_with_transform(path)
+    # CXR_FAST_DECODE=false is bit-identical to cxr_transform
+    assert exact_max == 0.0
+    assert fast_mean <= FAST_MEAN_TOLERANCE
+    assert fast_max <= FAST_MAX_TOLERANCE
@@ -0,0 +1,72 @@
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_export import BASE_DIR, FLAT_FOREST_PATH, FlatForest, flatten_forest
+
+
+def edge_rows(n_features, n_random=500, seed=0):
+    rng = np.random.RandomState(seed)
+    return np.vstack([
+        np.zeros(n_features),
+        np.ones(n_features),
+        np.eye(n_features),
+        rng.randint(0, 2, size=(n_random, n_features)),
+    ]).astype(np.float64)
+
+
+@pytest.fixture(scope='module')
+def fitted_forest():
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 2, size=(400, 12)).astype(np.float64)
+    y = (X[:, 0] + X[:, 3] * 2 + X[:, 7]).astype(int)
+    return RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+
+
+def test_matches_sklearn_on_binary_and_edge_rows(fitted_forest):
+    flat = FlatForest(flatten_forest(fitted_forest))
+    X = edge_rows(12)
+    np.testing.assert_allclose(flat.predict_proba(X), fitted_forest.predict_proba(X), atol=1e-9)
+
+
+def test_single_row_path_matches_batch_path(fitted_forest):
+    flat = FlatForest(flatten_forest(fitted_forest))
+    X = edge_rows(12, n_random=50)
+    single = np.vstack([flat.predict_proba(row) for row in X])
+    np.testing.assert_allclose(single, flat.predict_proba(X), atol=1e-12)
+    np.testing.assert_allclose(single, fitted_forest.predict_proba(X), atol=1e-9)
+
+
+def test_matches_sklearn_on_continuous_features():
+    rng = np.random.RandomState(1)
+    X = rng.normal(size=(300, 6))
+    y = (X[:, 0] > X[:, 1]).astype(int) + (X[:, 2] > 0.5)
+    forest = RandomForestClassifier(n_estimators=10, random_state=1).fit(X, y)
+    flat = FlatForest(flatten_forest(forest))
+    X_test = np.vstack([np.zeros(6), np.ones(6), rng.normal(size=(200, 6))])
+    np.testing.assert_allclose(flat.predict_proba(X_test), forest.predict_proba(X_test), atol=1e-9)
+
+
+def test_saved_round_trip(fitted_forest, tmp_path):
+    flat = FlatForest(flatten_forest(fitted_forest))
+    X = edge_rows(12, n_random=50)
+    for path in (str(tmp_path / 'flat'), str(tmp_path / 'flat.npz')):
+        flat.save(path)
+        np.testing.assert_allclose(FlatForest.load(path).predict_proba(X), flat.predict_proba(X))
+
+
+@pytest.mark.skipif(not os.path.isdir(FLAT_FOREST_PATH), reason="no exported flat forest")
+def test_shipped_flat_forest_matches_model_pkl():
+    with open(os.path.join(BASE_DIR, 'model.pkl'), 'rb') as f:
+        forest = pickle.load(f)
+    flat = FlatForest.load()
+    X = edge_rows(flat.n_features)
+    with warnings.catch_warnings():
+        # The model was fitted on a DataFrame; plain arrays are what /predict sends
+        warnings.simplefilter('ignore', UserWarning)
+        expected = forest.predict_proba(X)
+    np.testing.assert_allclose(flat.predict_proba(X), expected, atol=1e-9)
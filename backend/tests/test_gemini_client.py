@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gemini_client import CircuitBreaker, GeminiClient, GeminiError
+from result_cache import LRUCache
+
+
+class StubGemini:
+    """Local generateContent server; behavior(n) returns (delay_seconds, status) for the n-th request."""
+
+    def __init__(self, behavior=lambda n: (0, 200)):
+        self.behavior = behavior
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stub._lock:
+                    stub.requests += 1
+                    n = stub.requests
+                delay, status = stub.behavior(n)
+                time.sleep(delay)
+                body = json.dumps({'candidates': [{'content': {'parts': [{'text': f"answer {n}"}]}}]})
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body.encode('utf-8'))
+                except OSError:
+                    pass  # the client timed out and closed the connection
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/generateContent"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(behavior=lambda n: (0, 200)):
+        server = StubGemini(behavior)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
+
+
+def make_client(url, timeout=2.0, hedge_after=0.2, breaker=None):
+    return GeminiClient(api_key='test-key', url=url, timeout=timeout, hedge_after=hedge_after,
+                        breaker=breaker or CircuitBreaker(failure_threshold=2, reset_seconds=0.3),
+                        cache=LRUCache(16, 60))
+
+
+def test_slow_request_is_hedged_and_the_fast_answer_wins(stub):
+    server = stub(lambda n: (1.5, 200) if n == 1 else (0, 200))
+    client = make_client(server.url)
+    started = time.monotonic()
+    assert client.ask("what is flu") == "answer 2"
+    assert time.monotonic() - started < 1.0
+    assert client.stats()['hedged'] == 1
+
+
+def test_requests_stop_at_the_deadline(stub):
+    server = stub(lambda n: (3, 200))
+    client = make_client(server.url, timeout=0.5, hedge_after=0.1)
+    started = time.monotonic()
+    with pytest.raises(GeminiError):
+        client.ask("what is flu")
+    assert time.monotonic() - started < 1.0
+    # Both the first and the hedged request give up with the caller instead of waiting 3s
+    time.sleep(0.15)
+    assert client.stats()['in_flight'] == 0
+
+
+def test_breaker_opens_then_half_opens(stub):
+    healthy = threading.Event()
+    server = stub(lambda n: (0, 200 if healthy.is_set() else 500))
+    client = make_client(server.url, hedge_after=0)
+
+    for question in ("q1", "q2"):
+        with pytest.raises(GeminiError):
+            client.ask(question)
+    assert client.breaker.state == 'open'
+
+    # Open: fails fast without reaching the server
+    with pytest.raises(GeminiError):
+        client.ask("q3")
+    assert server.requests == 2
+
+    # Half-open after the reset time: a failed trial opens it again
+    time.sleep(0.35)
+    with pytest.raises(GeminiError):
+        client.ask("q4")
+    assert client.breaker.state == 'open'
+    assert server.requests == 3
+
+    # A successful trial closes it
+    healthy.set()
+    time.sleep(0.35)
+    assert client.ask("q5") == "answer 4"
+    assert client.breaker.state == 'closed'
+
+
+def test_repeated_questions_are_answered_from_the_cache(stub):
+    server = stub()
+    client = make_client(server.url)
+    assert client.ask("What is  Flu?") == "answer 1"
+    assert client.ask("what is flu") == "answer 1"
+    assert server.requests == 1
+    assert client.stats()['calls'] == 1
@@ -0,0 +1,145 @@
+import io
+import sqlite3
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import job_queue as job_queue_module
+from job_queue import DONE, JobQueue
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('L', (32, 32), color=128).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def wait_for_status(client, headers, job_id, statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/analyze-image/jobs/{job_id}", headers=headers).get_json()
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+@pytest.fixture
+def queue_paths(tmp_path):
+    return str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'data')
+
+
+def test_requeued_job_can_only_be_finished_by_its_new_claim(queue_paths):
+    db_path, data_dir = queue_paths
+    first = JobQueue(lambda job: None, db_path, data_dir, workers=0)
+    second = JobQueue(lambda job: None, db_path, data_dir, workers=0)
+    job = first.submit(1, [('a.png', png_bytes())])
+
+    claimed = first.claim()
+    assert claimed.id == job.id
+    # The first claimant stops sending heartbeats, as if its process had died
+    first._connection().execute("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (job.id,))
+
+    reclaimed = second.claim()
+    assert reclaimed.id == job.id and reclaimed.claim_token != claimed.claim_token
+    assert reclaimed.attempts == 2
+    assert first.finish(claimed, DONE, result={'from': 'first'}) is False
+    assert second.finish(reclaimed, DONE, result={'from': 'second'}) is True
+    assert second.get(job.id).result == {'from': 'second'}
+
+
+def test_heartbeat_keeps_a_long_job_from_being_requeued(queue_paths, monkeypatch):
+    monkeypatch.setattr(job_queue_module, 'JOB_STALE_SECONDS', 0.3)
+    monkeypatch.setattr(job_queue_module, 'JOB_HEARTBEAT_SECONDS', 0.05)
+    db_path, data_dir = queue_paths
+    release = threading.Event()
+
+    def slow_handler(job):
+        release.wait(5)
+        return {'ok': True}
+
+    worker = JobQueue(slow_handler, db_path, data_dir, workers=1)
+    other = JobQueue(lambda job: None, db_path, data_dir, workers=0)
+    job = worker.submit(1, [('a.png', png_bytes())])
+    worker.ensure_started()
+    try:
+        while worker.get(job.id).status != 'running':
+            time.sleep(0.01)
+        # Runs for several times JOB_STALE_SECONDS while another process keeps trying to claim
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            assert other.claim() is None
+            time.sleep(0.05)
+        release.set()
+        while worker.get(job.id).status != DONE:
+            time.sleep(0.02)
+    finally:
+        release.set()
+        worker.stop()
+    finished = worker.get(job.id)
+    assert finished.attempts == 1
+    assert finished.result == {'ok': True}
+
+
+def test_databases_from_before_claim_tokens_are_migrated(queue_paths):
+    db_path, data_dir = queue_paths
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, priority INTEGER NOT NULL, "
+        "status TEXT NOT NULL, payload TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+        "worker TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)")
+    connection.close()
+
+    queue = JobQueue(lambda job: None, db_path, data_dir, workers=0)
+    job = queue.submit(1, [('a.png', png_bytes())])
+    assert queue.claim().claim_token
+    assert queue.get(job.id).status == 'running'
+
+
+def test_job_lifecycle_through_the_api(client, signup, monkeypatch):
+    from app import job_queue
+    release = threading.Event()
+
+    def handler(job):
+        release.wait(10)
+        return {'images': len(job.payload['images'])}
+    monkeypatch.setattr(job_queue, 'handler', handler)
+
+    headers = signup()
+    response = client.post('/analyze-image/jobs', headers=headers, data={
+        'images': [(io.BytesIO(png_bytes()), 'front.png'), (io.BytesIO(png_bytes()), 'side.png')],
+        'priority': 'high'})
+    assert response.status_code == 202
+    first = response.get_json()
+    assert response.headers['Location'] == f"/analyze-image/jobs/{first['jobId']}"
+    assert first['images'] == 2 and first['priority'] == 'high'
+    wait_for_status(client, headers, first['jobId'], ('running',))
+
+    # The user's one running slot is taken, so the second job waits and can be cancelled
+    second = client.post('/analyze-image/jobs', headers=headers,
+                         data={'image': (io.BytesIO(png_bytes()), 'x.png')}).get_json()
+    assert client.get(f"/analyze-image/jobs/{second['jobId']}", headers=headers).get_json()['position'] == 0
+    assert client.delete(f"/analyze-image/jobs/{second['jobId']}", headers=headers).status_code == 200
+    assert client.delete(f"/analyze-image/jobs/{first['jobId']}", headers=headers).status_code == 409
+
+    # Jobs are private to their owner
+    assert client.get(f"/analyze-image/jobs/{first['jobId']}", headers=signup()).status_code == 404
+
+    release.set()
+    done = wait_for_status(client, headers, first['jobId'], ('done', 'failed'))
+    assert done['status'] == 'done'
+    assert done['result'] == {'images': 2}
+
+    listed = client.get('/analyze-image/jobs', headers=headers).get_json()['jobs']
+    assert {job['jobId']: job['status'] for job in listed} == {first['jobId']: 'done', second['jobId']: 'cancelled'}
+
+
+def test_invalid_job_requests(client, signup):
+    headers = signup()
+    assert client.post('/analyze-image/jobs', headers=headers, data={}).status_code == 400
+    response = client.post('/analyze-image/jobs', headers=headers, data={
+        'image': (io.BytesIO(png_bytes()), 'x.png'), 'priority': 'urgent'})
+    assert response.status_code == 400
+    assert client.post('/analyze-image/jobs', data={'image': (io.BytesIO(png_bytes()), 'x.png')}).status_code == 401
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+import torch
+
+from cxr_model import ChestXRayModel
+from mmap_weights import safetensors_path, save_safetensors, source_is_current, source_metadata
+from model_registry import load_cxr_model
+from model_store import ModelBundle
+
+NUM_CLASSES = 2
+
+
+def write_pt(path, seed):
+    torch.manual_seed(seed)
+    state_dict = ChestXRayModel(num_classes=NUM_CLASSES).state_dict()
+    torch.save(state_dict, path)
+    return state_dict
+
+
+def export(pt_path):
+    save_safetensors(torch.load(pt_path), safetensors_path(pt_path), metadata=source_metadata(pt_path))
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    os.makedirs(tmp_path / 'models')
+    return ModelBundle(str(tmp_path), 'test')
+
+
+def test_fresh_export_is_served_memory_mapped(bundle, capsys):
+    state_dict = write_pt(bundle.cxr_model_path, seed=0)
+    export(bundle.cxr_model_path)
+
+    cxr = load_cxr_model(NUM_CLASSES, bundle=bundle)
+    assert 'memory-mapped' in capsys.readouterr().out
+    assert torch.equal(cxr.model.backbone.fc.weight, state_dict['backbone.fc.weight'])
+    cxr.batcher.close()
+
+
+def test_replaced_pt_is_served_instead_of_stale_export(bundle, capsys):
+    write_pt(bundle.cxr_model_path, seed=0)
+    export(bundle.cxr_model_path)
+    retrained = write_pt(bundle.cxr_model_path, seed=1)
+
+    cxr = load_cxr_model(NUM_CLASSES, bundle=bundle)
+    out = capsys.readouterr().out
+    assert 'Ignoring' in out and 'memory-mapped' not in out
+    assert torch.equal(cxr.model.backbone.fc.weight, retrained['backbone.fc.weight'])
+    cxr.batcher.close()
+
+
+def test_touched_but_identical_pt_is_still_current(bundle):
+    write_pt(bundle.cxr_model_path, seed=0)
+    export(bundle.cxr_model_path)
+    os.utime(bundle.cxr_model_path, (1, 1))
+    assert source_is_current(safetensors_path(bundle.cxr_model_path), bundle.cxr_model_path)
+
+
+def test_export_without_source_hash_counts_as_stale(bundle):
+    state_dict = write_pt(bundle.cxr_model_path, seed=0)
+    save_safetensors(state_dict, safetensors_path(bundle.cxr_model_path), metadata={'source': 'cxr_model.pt'})
+    assert not source_is_current(safetensors_path(bundle.cxr_model_path), bundle.cxr_model_path)
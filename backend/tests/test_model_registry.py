@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import model_registry
+from model_registry import ModelRegistry
+
+
+def flaky_registry(failures):
+    calls = []
+
+    def loader(bundle):
+        calls.append(bundle.version)
+        if len(calls) <= failures:
+            raise MemoryError("out of memory")
+        return SimpleNamespace(version=bundle.version)
+
+    registry = ModelRegistry(bundle=SimpleNamespace(version='v1'))
+    registry.register('symptom', loader)
+    return registry, calls
+
+
+def test_failed_load_is_retried_after_the_backoff(monkeypatch):
+    monkeypatch.setattr(model_registry, 'MODEL_LOAD_RETRY_SECONDS', 60)
+    registry, calls = flaky_registry(failures=1)
+    assert registry.get('symptom') is None
+    # Within the backoff the loader is not run again
+    assert registry.get('symptom') is None
+    assert len(calls) == 1
+    report = registry.report()['models']['symptom']
+    assert report['attempted'] and not report['loaded'] and report['error'] == 'out of memory'
+
+    monkeypatch.setattr(model_registry, 'MODEL_LOAD_RETRY_SECONDS', 0)
+    assert registry.get('symptom').version == 'v1'
+    assert len(calls) == 2
+    assert 'error' not in registry.report()['models']['symptom']
+
+
+def test_absent_model_is_not_retried(monkeypatch):
+    monkeypatch.setattr(model_registry, 'MODEL_LOAD_RETRY_SECONDS', 0)
+    calls = []
+    registry = ModelRegistry(bundle=SimpleNamespace(version='v1'))
+    registry.register('cxr', lambda bundle: calls.append(bundle) or None)
+    assert registry.get('cxr') is None and registry.get('cxr') is None
+    assert len(calls) == 1
+
+
+def test_health_probe_does_not_load_models(client, monkeypatch):
+    from app import model_registry as registry
+
+    def no_loading(name):
+        raise AssertionError(f"/health loaded the {name} model")
+    monkeypatch.setattr(registry, 'get', no_loading)
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['model_loaded'] == registry.is_loaded('symptom')
@@ -0,0 +1,67 @@
+import os
+import threading
+
+import pytest
+
+import password_pool
+from password_pool import BoundedExecutor, PoolSaturated, PoolTimeout, hash_password_pooled, verify_password_pooled
+
+
+def test_full_pool_is_rejected():
+    pool = BoundedExecutor(workers=1, max_pending=0)
+    release = threading.Event()
+    pool.submit(release.wait)
+    with pytest.raises(PoolSaturated):
+        pool.submit(release.wait)
+    release.set()
+    assert pool.stats()['rejected'] == 1
+
+
+def test_slow_work_times_out():
+    pool = BoundedExecutor(workers=1, max_pending=1)
+    release = threading.Event()
+    with pytest.raises(PoolTimeout):
+        pool.run(release.wait, timeout=0.05)
+    release.set()
+    assert pool.stats()['timed_out'] == 1
+
+
+def test_login_answers_503_when_hashing_times_out(client, signup, monkeypatch):
+    signup('slow@test.local')
+
+    def timed_out(*args, **kwargs):
+        raise PoolTimeout("Password hashing is taking too long, please retry shortly.")
+    monkeypatch.setattr(password_pool.password_pool, 'run', timed_out)
+
+    response = client.post('/auth/login', json={'email': 'slow@test.local', 'password': 'secret-password'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_signup_answers_429_when_pool_is_full(client, monkeypatch):
+    def saturated(*args, **kwargs):
+        raise PoolSaturated("Password hashing is at capacity, please retry shortly.")
+    monkeypatch.setattr(password_pool.password_pool, 'run', saturated)
+
+    response = client.post('/auth/signup', json={
+        'username': 'busy', 'email': 'busy@test.local', 'password': 'secret-password'})
+    assert response.status_code == 429
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+def test_pool_used_before_a_fork_still_works_in_the_child():
+    # As with the preloaded app: the master hashes the default admin's password, then forks workers
+    hashed = hash_password_pooled('secret-password', rounds=4)
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            ok = verify_password_pooled('secret-password', hashed)
+            ok = ok and password_pool.password_pool.run(len, 'abc', timeout=5) == 3
+            code = 0 if ok else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    # The parent's pool is untouched
+    assert verify_password_pooled('secret-password', hashed)
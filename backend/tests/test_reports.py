@@ -0,0 +1,69 @@
+def create_reports(client, headers, count):
+    response = client.post('/api/reports', headers=headers,
+                           json=[{'title': f"report {i}", 'index': i} for i in range(count)])
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def fetch_all_pages(client, headers, limit):
+    reports, pages, cursor = [], 0, None
+    while True:
+        query = f"/api/reports?limit={limit}" + (f"&cursor={cursor}" if cursor else '')
+        response = client.get(query, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= limit
+        reports.extend(page)
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return reports, pages
+
+
+def test_keyset_pages_cover_every_report_once_newest_first(client, signup):
+    headers = signup()
+    created = create_reports(client, headers, 7)
+    # Reports inserted together share created_at, so the id breaks the tie
+    assert len({report['created_at'] for report in created}) == 1
+
+    reports, pages = fetch_all_pages(client, headers, limit=3)
+    assert pages == 3
+    ids = [int(report['id']) for report in reports]
+    assert ids == sorted((int(report['id']) for report in created), reverse=True)
+
+
+def test_exact_multiple_of_page_size_has_no_empty_last_page(client, signup):
+    headers = signup()
+    create_reports(client, headers, 4)
+    reports, pages = fetch_all_pages(client, headers, limit=2)
+    assert len(reports) == 4
+    assert pages == 2
+
+
+def test_reports_are_private_to_their_owner(client, signup):
+    owner, other = signup(), signup()
+    create_reports(client, owner, 2)
+    response = client.get('/api/reports', headers=other)
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+def test_fields_filter_and_reserved_fields(client, signup):
+    headers = signup()
+    saved = client.post('/api/reports', headers=headers,
+                        json={'title': 'x', 'diagnosis': 'flu', 'user_id': 999, 'id': 'forged'}).get_json()
+    assert saved['user_id'] != 999
+    assert saved['id'] != 'forged'
+
+    response = client.get('/api/reports?fields=diagnosis', headers=headers)
+    assert response.get_json() == [{'id': saved['id'], 'diagnosis': 'flu'}]
+
+
+def test_invalid_cursor_and_limit(client, signup):
+    headers = signup()
+    assert client.get('/api/reports?cursor=not-a-cursor', headers=headers).status_code == 400
+    assert client.get('/api/reports?limit=abc', headers=headers).status_code == 400
+
+
+def test_reports_require_a_token(client):
+    assert client.get('/api/reports').status_code == 401
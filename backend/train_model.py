@@ -1,73 +1,222 @@
-import pandas as pd
+"""
+Train the symptom -> disease Random Forest.
+
+By default the synthetic dataset below is generated; pass --data to train on
+a real CSV, which is streamed in chunks so millions of rows fit in memory as
+a compact uint8 matrix. Two CSV layouts are accepted:
+  wide  Disease, fever, cough, ...      (0/1 per symptom column)
+  long  Disease, Symptom_1, Symptom_2, ... (symptom names as values)
+
+The artifacts are written to a staging directory and published as a new
+version of the model store (see model_store.py), or installed into
+--output-dir file by file with atomic renames.
+
+Usage:
+    python train_model.py [--data dataset.csv] [--search] [--activate]
+    python train_model.py --output-dir .          # previous behaviour: write next to app.py
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
 import numpy as np
-from sklearn.model_selection import train_test_split
+import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import pickle
-import seaborn as sns
-import matplotlib.pyplot as plt
+from sklearn.model_selection import RandomizedSearchCV, train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from forest_export import export_forest
+from model_store import ModelStoreError, activate, current_bundle, publish
+from symptom_index import normalize_symptom
+
+CSV_CHUNK_ROWS = 200_000
+PARITY_CHECK_ROWS = 10_000
+
+DISEASES = [
+    'Common Cold', 'Influenza', 'Migraine', 'Gastroenteritis',
+    'Pneumonia', 'Bronchitis', 'Sinusitis', 'Allergic Rhinitis'
+]
 
+SYMPTOMS = [
+    'fever', 'cough', 'headache', 'nausea', 'fatigue', 'runny_nose',
+    'sore_throat', 'muscle_aches', 'chills', 'vomiting', 'diarrhea',
+    'shortness_of_breath', 'chest_pain', 'sneezing', 'nasal_congestion'
+]
 
-def load_and_preprocess_data():
+# Map each disease to common symptoms
+DISEASE_SYMPTOM_MAP = {
+    'Common Cold': ['runny_nose', 'sneezing', 'cough', 'sore_throat', 'fatigue'],
+    'Influenza': ['fever', 'chills', 'muscle_aches', 'fatigue', 'headache', 'cough'],
+    'Migraine': ['headache', 'nausea', 'fatigue'],
+    'Gastroenteritis': ['nausea', 'vomiting', 'diarrhea', 'fever'],
+    'Pneumonia': ['cough', 'fever', 'chills', 'shortness_of_breath', 'chest_pain'],
+    'Bronchitis': ['cough', 'fatigue', 'shortness_of_breath', 'chest_pain'],
+    'Sinusitis': ['headache', 'nasal_congestion', 'runny_nose', 'fatigue'],
+    'Allergic Rhinitis': ['sneezing', 'runny_nose', 'nasal_congestion']
+}
+
+# Search space for --search
+PARAM_DISTRIBUTIONS = {
+    'n_estimators': [100, 200, 400],
+    'max_depth': [8, 10, 14, 20, None],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 'log2', None],
+}
+
+
+def load_and_preprocess_data(samples_per_disease=100, seed=42):
     """
-    Load and preprocess the disease-symptom dataset.
-    Expected CSV format: Disease, Symptom_1, Symptom_2, ..., Symptom_n
+    Generate the synthetic disease-symptom dataset.
+
+    Returns (X, y, symptom_columns): a uint8 (n, n_symptoms) matrix, the disease
+    name of every row, and the column names.
     """
-    print("Loading dataset...")
-
-    diseases = [
-        'Common Cold', 'Influenza', 'Migraine', 'Gastroenteritis',
-        'Pneumonia', 'Bronchitis', 'Sinusitis', 'Allergic Rhinitis'
-    ]
-
-    symptoms = [
-        'fever', 'cough', 'headache', 'nausea', 'fatigue', 'runny_nose',
-        'sore_throat', 'muscle_aches', 'chills', 'vomiting', 'diarrhea',
-        'shortness_of_breath', 'chest_pain', 'sneezing', 'nasal_congestion'
-    ]
-
-    # Map each disease to common symptoms
-    disease_symptom_map = {
-        'Common Cold': ['runny_nose', 'sneezing', 'cough', 'sore_throat', 'fatigue'],
-        'Influenza': ['fever', 'chills', 'muscle_aches', 'fatigue', 'headache', 'cough'],
-        'Migraine': ['headache', 'nausea', 'fatigue'],
-        'Gastroenteritis': ['nausea', 'vomiting', 'diarrhea', 'fever'],
-        'Pneumonia': ['cough', 'fever', 'chills', 'shortness_of_breath', 'chest_pain'],
-        'Bronchitis': ['cough', 'fatigue', 'shortness_of_breath', 'chest_pain'],
-        'Sinusitis': ['headache', 'nasal_congestion', 'runny_nose', 'fatigue'],
-        'Allergic Rhinitis': ['sneezing', 'runny_nose', 'nasal_congestion']
-    }
+    print("Generating synthetic dataset...")
+    rng = np.random.default_rng(seed)
 
-    np.random.seed(42)
-    data = []
+    # 80% chance of having the symptom if common for the disease, else 10% chance
+    probabilities = np.array([[0.8 if s in DISEASE_SYMPTOM_MAP[d] else 0.1 for s in SYMPTOMS] for d in DISEASES])
+    labels = np.repeat(np.arange(len(DISEASES)), samples_per_disease)
+    X = (rng.random((len(labels), len(SYMPTOMS))) < probabilities[labels]).astype(np.uint8)
+    y = np.asarray(DISEASES, dtype=object)[labels]
 
-    for disease in diseases:
-        for _ in range(100):  # 100 samples per disease
-            row = {'Disease': disease}
-            for symptom in symptoms:
-                # 80% chance of having the symptom if common, else 10% chance
-                if symptom in disease_symptom_map[disease]:
-                    row[symptom] = np.random.choice([0, 1], p=[0.2, 0.8])
-                else:
-                    row[symptom] = np.random.choice([0, 1], p=[0.9, 0.1])
-            data.append(row)
+    print(f"Dataset shape: {X.shape}")
+    print(f"Diseases: {DISEASES}")
+    return X, y, list(SYMPTOMS)
 
-    df = pd.DataFrame(data)
-    print(f"Dataset shape: {df.shape}")
-    print(f"Diseases: {df['Disease'].unique()}")
-    return df
 
+def load_csv_dataset(path, target='Disease', chunksize=CSV_CHUNK_ROWS):
+    """Stream a wide (0/1 columns) or long (symptom-name cells) CSV into (X, y, symptom_columns)."""
+    print(f"Loading dataset from {path} in chunks of {chunksize} rows...")
+    labels, wide_parts = [], []
+    long_rows, long_cols = [], []
+    columns = None
+    wide = None
+    n_rows = 0
 
-def train_model():
-    """Train the Random Forest model."""
-    print("Starting model training...")
+    for chunk in pd.read_csv(path, chunksize=chunksize, skipinitialspace=True):
+        labels.append(chunk[target].astype(str).str.strip().to_numpy(dtype=object))
+        features = chunk.drop(columns=[target]).reset_index(drop=True)
+        if wide is None:
+            wide = all(pd.api.types.is_numeric_dtype(dtype) for dtype in features.dtypes)
+            columns = [normalize_symptom(c) for c in features.columns] if wide else {}
+
+        if wide:
+            wide_parts.append((features.fillna(0).to_numpy() > 0).astype(np.uint8))
+        else:
+            # One (row, symptom name) pair per filled cell
+            cells = features.stack().dropna()
+            names = cells.astype(str).map(normalize_symptom)
+            cells, names = cells[names != ''], names[names != '']
+            for name in pd.unique(names):
+                columns.setdefault(name, len(columns))
+            long_rows.append(cells.index.get_level_values(0).to_numpy() + n_rows)
+            long_cols.append(names.map(columns).to_numpy(dtype=np.int64))
+        n_rows += len(chunk)
+        print(f"  {n_rows} rows read")
+
+    y = np.concatenate(labels)
+    if wide:
+        return np.concatenate(wide_parts), y, columns
+
+    X = np.zeros((n_rows, len(columns)), dtype=np.uint8)
+    X[np.concatenate(long_rows), np.concatenate(long_cols)] = 1
+    return X, y, sorted(columns, key=columns.get)
+
+
+def fit_forest(X_train, y_train, n_jobs=-1, search=False, search_iter=20, cv=3, seed=42):
+    """Fit on all cores; with search=True, pick hyperparameters by parallel randomized search first."""
+    base = RandomForestClassifier(
+        n_estimators=100,
+        random_state=seed,
+        max_depth=10,
+        min_samples_split=5,
+        n_jobs=n_jobs
+    )
+    if not search:
+        return base.fit(X_train, y_train), None
 
-    df = load_and_preprocess_data()
+    print(f"Running hyperparameter search ({search_iter} candidates, {cv}-fold CV)...")
+    # Candidates run in parallel, so each one fits single-threaded
+    base.set_params(n_jobs=1)
+    searcher = RandomizedSearchCV(base, PARAM_DISTRIBUTIONS, n_iter=search_iter, cv=cv,
+                                  n_jobs=n_jobs, random_state=seed, refit=False)
+    searcher.fit(X_train, y_train)
+    print(f"Best parameters: {searcher.best_params_} (CV accuracy {searcher.best_score_:.4f})")
+    model = base.set_params(n_jobs=n_jobs, **searcher.best_params_).fit(X_train, y_train)
+    return model, {'best_params': searcher.best_params_, 'best_cv_accuracy': float(searcher.best_score_)}
 
-    # Separate features and target
-    X = df.drop('Disease', axis=1)
-    y = df['Disease']
+
+def save_confusion_matrix(cm, class_names, path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
+                xticklabels=class_names,
+                yticklabels=class_names)
+    plt.title('Confusion Matrix')
+    plt.ylabel('True Label')
+    plt.xlabel('Predicted Label')
+    plt.xticks(rotation=45)
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def write_artifacts(out_dir, model, label_encoder, symptom_columns, X_check, report, plot_cm=None):
+    with open(os.path.join(out_dir, 'model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    with open(os.path.join(out_dir, 'label_encoder.pkl'), 'wb') as f:
+        pickle.dump(label_encoder, f)
+    with open(os.path.join(out_dir, 'symptom_columns.pkl'), 'wb') as f:
+        pickle.dump(list(symptom_columns), f)
+
+    # Flattened copy of the forest for the serving path, checked against predict_proba
+    export_forest(model, os.path.join(out_dir, 'model_flat'), check_X=X_check,
+                  class_labels=label_encoder.classes_)
+
+    with open(os.path.join(out_dir, 'training_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    if plot_cm is not None:
+        save_confusion_matrix(plot_cm, label_encoder.classes_, os.path.join(out_dir, 'confusion_matrix.png'))
+
+
+def install_artifacts(staging, out_dir):
+    """Move staged artifacts into out_dir; each file (or model_flat/) is swapped in with a rename."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name in sorted(os.listdir(staging)):
+        source, target = os.path.join(staging, name), os.path.join(out_dir, name)
+        if os.path.isdir(source) and os.path.isdir(target):
+            retired = f"{target}.old"
+            shutil.rmtree(retired, ignore_errors=True)
+            os.replace(target, retired)
+            os.replace(source, target)
+            shutil.rmtree(retired)
+        else:
+            os.replace(source, target)
+
+
+def train_model(data_path=None, samples_per_disease=100, n_jobs=-1, search=False, search_iter=20,
+                output_dir=None, version=None, activate_version=False, plot=True):
+    """Train the Random Forest model and publish or install its artifacts."""
+    print("Starting model training...")
+    started = time.perf_counter()
+
+    if data_path:
+        X, y, symptom_columns = load_csv_dataset(data_path)
+    else:
+        X, y, symptom_columns = load_and_preprocess_data(samples_per_disease)
 
     # Encode disease labels
     label_encoder = LabelEncoder()
@@ -81,57 +230,84 @@ def train_model():
     print(f"Training set size: {X_train.shape[0]}")
     print(f"Test set size: {X_test.shape[0]}")
 
-    # Train Random Forest
-    model = RandomForestClassifier(
-        n_estimators=100,
-        random_state=42,
-        max_depth=10,
-        min_samples_split=5
-    )
-    model.fit(X_train, y_train)
+    fit_started = time.perf_counter()
+    model, search_result = fit_forest(X_train, y_train, n_jobs=n_jobs, search=search, search_iter=search_iter)
+    fit_seconds = time.perf_counter() - fit_started
 
     # Predictions & evaluation
     y_pred = model.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
-    print(f"Model Accuracy: {accuracy:.4f}")
+    print(f"Model Accuracy: {accuracy:.4f} (fit in {fit_seconds:.1f}s)")
     print("\nClassification Report:")
     print(classification_report(y_test, y_pred, target_names=label_encoder.classes_))
 
     # Feature importances
     feature_importance = pd.DataFrame({
-        'feature': X.columns,
+        'feature': symptom_columns,
         'importance': model.feature_importances_
     }).sort_values('importance', ascending=False)
     print("\nTop 10 Most Important Features:")
     print(feature_importance.head(10))
 
-    # Save model and artifacts
-    with open('model.pkl', 'wb') as f:
-        pickle.dump(model, f)
-    with open('label_encoder.pkl', 'wb') as f:
-        pickle.dump(label_encoder, f)
-    with open('symptom_columns.pkl', 'wb') as f:
-        pickle.dump(list(X.columns), f)
+    report = {
+        'rows': int(X.shape[0]),
+        'features': len(symptom_columns),
+        'classes': len(label_encoder.classes_),
+        'accuracy': float(accuracy),
+        'fit_seconds': round(fit_seconds, 2),
+        'params': {k: v for k, v in model.get_params().items() if k != 'n_jobs'},
+        'data': os.path.basename(data_path) if data_path else f"synthetic:{samples_per_disease}",
+    }
+    if search_result:
+        report['search'] = search_result
 
-    print("Model training completed successfully!")
+    # Everything is written to a staging directory first, so nothing half-written is ever served
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.train-', dir=output_dir or None)
+    try:
+        write_artifacts(staging, model, label_encoder, symptom_columns, X_test[:PARITY_CHECK_ROWS], report,
+                        plot_cm=confusion_matrix(y_test, y_pred) if plot else None)
+        if output_dir:
+            install_artifacts(staging, output_dir)
+            print(f"Artifacts installed in '{os.path.abspath(output_dir)}'")
+        else:
+            manifest = publish(staging, version, inherit_dir=current_bundle().root,
+                               metadata={'accuracy': report['accuracy'], 'rows': report['rows']})
+            print(f"Published model version '{manifest['version']}'")
+            if activate_version:
+                activate(manifest['version'])
+                print(f"Activated model version '{manifest['version']}'")
+            else:
+                print(f"Make it live with: python model_store.py activate {manifest['version']}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
 
-    # Plot confusion matrix
-    cm = confusion_matrix(y_test, y_pred)
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
-                xticklabels=label_encoder.classes_,
-                yticklabels=label_encoder.classes_)
-    plt.title('Confusion Matrix')
-    plt.ylabel('True Label')
-    plt.xlabel('Predicted Label')
-    plt.xticks(rotation=45)
-    plt.yticks(rotation=0)
-    plt.tight_layout()
-    plt.savefig('confusion_matrix.png')
-    print("Confusion matrix saved as 'confusion_matrix.png'")
+    print(f"Model training completed successfully in {time.perf_counter() - started:.1f}s!")
+    return model, label_encoder, symptom_columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the symptom Random Forest.")
+    parser.add_argument('--data', help="CSV dataset (wide 0/1 columns or long symptom names); synthetic if omitted")
+    parser.add_argument('--samples-per-disease', type=int, default=100, help="synthetic rows per disease")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="cores for fitting and search (-1 = all)")
+    parser.add_argument('--search', action='store_true', help="randomized hyperparameter search before the final fit")
+    parser.add_argument('--search-iter', type=int, default=20)
+    parser.add_argument('--output-dir', help="install artifacts here instead of publishing a model store version")
+    parser.add_argument('--version', help="model store version name (default: timestamp)")
+    parser.add_argument('--activate', action='store_true', help="make the published version live")
+    parser.add_argument('--no-plot', action='store_true', help="skip the confusion matrix image")
+    args = parser.parse_args(argv)
 
-    return model, label_encoder, X.columns
+    try:
+        train_model(args.data, args.samples_per_disease, args.n_jobs, args.search, args.search_iter,
+                    args.output_dir, args.version, args.activate, plot=not args.no_plot)
+    except ModelStoreError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    train_model()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,28 @@
+"""
+Production WSGI entry point:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py preloads this module in the master, so the models below are
+loaded once and shared with every forked worker through copy-on-write.
+`python app.py` remains the single-process development server.
+"""
+import gc
+import os
+import sys
+
+from app import app, job_queue, model_registry
+
+WSGI_PRELOAD_MODELS = os.environ.get('WSGI_PRELOAD_MODELS', 'true').lower() in ('1', 'true', 'yes')
+
+if WSGI_PRELOAD_MODELS:
+    model_registry.warmup()
+
+# Move everything loaded so far out of the collector's reach, so GC passes in the
+# workers don't write to (and un-share) the pages holding the preloaded models
+gc.freeze()
+
+# Under gunicorn this is the master: its workers start the job workers in post_worker_init.
+# Any other WSGI server imports this module in the process that serves requests.
+if 'gunicorn' not in sys.modules:
+    job_queue.ensure_started()